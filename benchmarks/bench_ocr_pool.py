@@ -0,0 +1,44 @@
+'''
+Benchmark for concurrent OCR of table images.
+
+Processes the same table images with an increasing number of OCR workers, checks the output is identical to the
+single worker run and reports the speedup. Needs tesseract to be installed, unless the stub OCR engine is used.
+
+run from the repository root:
+$ python -m benchmarks.bench_ocr_pool -i path/to/PMC1_table_1.png path/to/PMC1_table_2.png -w 1 2 4 8
+'''
+
+import argparse
+import json
+import time
+
+from src.table_image import table_image
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--images', type=str, nargs='+', required=True, help="table image file paths")
+	parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="worker counts to benchmark")
+	parser.add_argument('-m', '--ocr_mode', type=str, choices=['cell', 'image'], default='cell', help="OCR mode")
+	parser.add_argument('-e', '--ocr_engine', type=str, choices=['tesseract', 'tesserocr', 'stub'], default='tesseract',
+	                    help="OCR engine, 'stub' measures everything but OCR")
+	parser.add_argument('-b', '--ocr_batch', type=int, default=1, help="cells read by one OCR engine call")
+	args = parser.parse_args()
+
+	baseline = None
+	base_time = None
+	print("{:>8} {:>10} {:>8} {:>10}".format("workers", "seconds", "speedup", "identical"))
+	for workers in args.workers:
+		start = time.perf_counter()
+		tables = table_image(args.images, ocr_mode=args.ocr_mode, ocr_workers=workers, ocr_engine=args.ocr_engine,
+		                     ocr_batch=args.ocr_batch).to_dict()
+		elapsed = time.perf_counter() - start
+		output = json.dumps(tables["documents"], ensure_ascii=False)
+		if baseline is None:
+			baseline = output
+			base_time = elapsed
+		print("{:>8} {:>10.2f} {:>8.2f} {:>10}".format(workers, elapsed, base_time / elapsed, str(output == baseline)))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,103 @@
+'''
+Benchmark for table image preprocessing.
+
+Decodes each image and finds its cells with the 'full' and 'lean' preprocessing and the 'contour' and 'grid' cell
+detectors of table_image, reporting the time per image, the peak memory allocated while doing so and how far the lean
+cells are from the full resolution ones.
+No OCR is run, so tesseract is not needed. Without images, a synthetic 300 dpi A4 scan of a ruled table is used.
+
+run from the repository root:
+$ python -m benchmarks.bench_preprocess -i path/to/PMC1_table_1.png -r 5
+'''
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from src.table_image import table_image
+
+
+def synthetic_scan(path, n_rows=18, n_cols=8):
+	"""
+	draw a ruled table on a white 300 dpi A4 page
+
+	Args:
+		path: image file path to write
+		n_rows: number of table rows
+		n_cols: number of table columns
+
+	"""
+	img = np.full((3508, 2480, 3), 255, dtype=np.uint8)
+	left, top, cell_w, cell_h = 120, 200, 280, 170
+	for r in range(n_rows + 1):
+		cv2.line(img, (left, top + r * cell_h), (left + n_cols * cell_w, top + r * cell_h), (0, 0, 0), 4)
+	for c in range(n_cols + 1):
+		cv2.line(img, (left + c * cell_w, top), (left + c * cell_w, top + n_rows * cell_h), (0, 0, 0), 4)
+	for r in range(n_rows):
+		for c in range(n_cols):
+			cv2.putText(img, 'r{}c{}'.format(r, c), (left + c * cell_w + 30, top + r * cell_h + 100),
+			            cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 3)
+	cv2.imwrite(path, img)
+
+
+def run(tables, image_path):
+	if tables.preprocess == 'lean':
+		return tables.find_cells_lean(cv2.imread(image_path, cv2.IMREAD_GRAYSCALE))[0]
+	return tables.find_cells(cv2.imread(image_path))[0]
+
+
+def cell_offset(cells, reference):
+	"""
+	Returns:
+		largest coordinate difference between matching cells, or None if the cell counts differ
+
+	"""
+	if len(cells) != len(reference):
+		return None
+	return int(np.abs(np.array(sorted(cells)) - np.array(sorted(reference))).max()) if cells else 0
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--images', type=str, nargs='+', help="table image file paths")
+	parser.add_argument('-r', '--repeat', type=int, default=5, help="runs per image and mode")
+	parser.add_argument('-s', '--max_side', type=int, default=2000, help="max_side of the lean preprocessing")
+	args = parser.parse_args()
+
+	images = args.images
+	if not images:
+		images = [os.path.join(tempfile.mkdtemp(), 'scan_table_1.png')]
+		synthetic_scan(images[0])
+
+	print("{:<24} {:>6} {:>8} {:>10} {:>10} {:>7} {:>12}".format(
+		"image", "mode", "detector", "ms", "peak MB", "cells", "max offset"))
+	for image_path in images:
+		for detector in ['contour', 'grid']:
+			reference = None
+			for mode in ['full', 'lean']:
+				# no OCR is run, so an empty table_image only provides the preprocessing
+				tables = table_image([], preprocess=mode, max_side=args.max_side, cell_detector=detector)
+				# warm up, so buffers reused across images are not counted as the first image's allocations
+				cells = run(tables, image_path)
+				start = time.perf_counter()
+				for _ in range(args.repeat):
+					run(tables, image_path)
+				elapsed = (time.perf_counter() - start) / args.repeat
+				tracemalloc.start()
+				run(tables, image_path)
+				peak = tracemalloc.get_traced_memory()[1]
+				tracemalloc.stop()
+				if reference is None:
+					reference = cells
+				print("{:<24} {:>6} {:>8} {:>10.1f} {:>10.1f} {:>7} {:>12}".format(
+					os.path.basename(image_path)[-24:], mode, detector, elapsed * 1000, peak / 1024 ** 2, len(cells),
+					str(cell_offset(cells, reference))))
+
+
+if __name__ == "__main__":
+	main()
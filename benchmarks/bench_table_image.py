@@ -0,0 +1,117 @@
+'''
+Benchmark and accuracy check for table image processing.
+
+Runs the stages of table_image one by one on a table image corpus with ground truth (see table_image_corpus), timing
+image decoding, find_cells, cell2table (OCR) and text2json separately and reporting cells per second for each. The
+output is compared with the ground truth: table shape (header and body rows with the right number of cells), cell
+text at each position, and title. Without a corpus, one is generated in a temporary directory.
+
+Text accuracy needs a real OCR engine, the stub engine only reads empty cells correctly but isolates the cost of image
+processing. Needs tesseract to be installed unless the stub engine is used.
+
+run from the repository root:
+$ python -m benchmarks.bench_table_image -c synthetic_tables -e tesseract -d grid -w 4
+'''
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+import cv2
+
+from benchmarks.table_image_corpus import generate
+from src.ocr_pool import ocr_pool
+from src.table_image import table_image
+
+STAGES = ['decode', 'find_cells', 'cell2table', 'text2json']
+
+
+def normalise(text):
+	return ' '.join(str(text).split())
+
+
+def score(table, truth):
+	"""
+	compare a table read by text2json with its ground truth
+
+	Returns:
+		(True if the shape matches, cells read correctly, cells in the ground truth, True if the title matches)
+
+	"""
+	expected = [truth['columns']] + truth['rows']
+	read = [table.get('columns', [])] + [row for section in table.get('section', []) for row in section['results']]
+	shape = len(read) == len(expected) and all(len(r) == len(e) for r, e in zip(read, expected))
+	correct = 0
+	for read_row, expected_row in zip(read, expected):
+		correct += sum(normalise(r) == normalise(e) for r, e in zip(read_row, expected_row))
+	total = sum(len(row) for row in expected)
+	title = normalise(table.get('identifier', '')) == truth['identifier'] and normalise(table.get('title', '')) == truth['title']
+	return shape, correct, total, title
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-c', '--corpus', type=str, help="directory of table images with ground truth json files")
+	parser.add_argument('-n', '--n_tables', type=int, default=20, help="tables to generate when no corpus is given")
+	parser.add_argument('-e', '--ocr_engine', type=str, choices=['tesseract', 'tesserocr', 'stub'], default='tesseract',
+	                    help="OCR engine")
+	parser.add_argument('-m', '--ocr_mode', type=str, choices=['cell', 'image'], default='cell', help="OCR mode")
+	parser.add_argument('-w', '--ocr_workers', type=int, default=1, help="OCR workers")
+	parser.add_argument('-b', '--ocr_batch', type=int, default=1, help="cells read by one OCR engine call")
+	parser.add_argument('-d', '--cell_detector', type=str, choices=['contour', 'grid'], default='contour',
+	                    help="cell detector")
+	parser.add_argument('-p', '--preprocess', type=str, choices=['full', 'lean'], default='full', help="preprocessing")
+	args = parser.parse_args()
+
+	corpus = args.corpus
+	if not corpus:
+		corpus = tempfile.mkdtemp()
+		generate(corpus, args.n_tables, rulings=('full', 'booktabs'), noise=(0, 10), skew=(0, 0.5), scale=(1, 2))
+	images = sorted(glob.glob(os.path.join(corpus, '*_table_*.png')))
+
+	tables = table_image([], ocr_mode=args.ocr_mode, ocr_engine=args.ocr_engine, ocr_batch=args.ocr_batch,
+	                     cell_detector=args.cell_detector, preprocess=args.preprocess)
+	# the pool of an empty table_image is already shut down
+	tables.pool = ocr_pool(args.ocr_workers)
+	times = dict.fromkeys(STAGES, 0.0)
+	n_cells = n_shape = n_correct = n_total = n_title = 0
+	with tables.pool:
+		for image_path in images:
+			with open(image_path[:-len('.png')] + '.json') as f:
+				truth = json.load(f)
+			start = time.perf_counter()
+			img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE if args.preprocess == 'lean' else cv2.IMREAD_COLOR)
+			decoded = time.perf_counter()
+			if args.preprocess == 'lean':
+				cells, added, thresh = tables.find_cells_lean(img)
+			else:
+				cells, added, thresh = tables.find_cells(img)
+			found = time.perf_counter()
+			table_row = tables.cell2table(cells, added, thresh, None, os.path.basename(image_path))
+			read = time.perf_counter()
+			table = tables.text2json(table_row)
+			end = time.perf_counter()
+
+			for stage, elapsed in zip(STAGES, [decoded - start, found - decoded, read - found, end - read]):
+				times[stage] += elapsed
+			n_cells += len(cells)
+			shape, correct, total, title = score(table, truth)
+			n_shape += shape
+			n_correct += correct
+			n_total += total
+			n_title += title
+
+	print("{} tables, {} cells found, {} cells in the ground truth".format(len(images), n_cells, n_total))
+	print("{:<12} {:>10} {:>12} {:>12}".format("stage", "seconds", "ms/table", "cells/s"))
+	for stage in STAGES:
+		print("{:<12} {:>10.3f} {:>12.1f} {:>12.0f}".format(
+			stage, times[stage], times[stage] * 1000 / max(len(images), 1), n_cells / times[stage] if times[stage] else 0))
+	print("shape match {:.1%}, cell text match {:.1%}, title match {:.1%}".format(
+		n_shape / max(len(images), 1), n_correct / max(n_total, 1), n_title / max(len(images), 1)))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,51 @@
+'''
+Scaling benchmark for section detection in the index column of large tables.
+
+Builds tables where every value in the first column appears twice, the worst case for
+section detection as half the rows become section rows, and reports the time spent in
+table processing (excluding HTML parsing) per row. A flat time per row means linear scaling.
+
+run from the repository root:
+$ python -m benchmarks.bench_table_sections -r 10000 20000 50000 100000
+'''
+
+import argparse
+import json
+import time
+from bs4 import BeautifulSoup
+
+from src.table import table
+
+
+def build_table_html(n_rows, n_cols):
+	rows = ['<tr>' + ''.join('<th>Col{}</th>'.format(c) for c in range(n_cols)) + '</tr>']
+	for r in range(n_rows):
+		cells = ['<td>group {}</td>'.format(r // 2)]
+		cells += ['<td>{}</td>'.format(r * c) for c in range(1, n_cols)]
+		rows.append('<tr>' + ''.join(cells) + '</tr>')
+	return '<html><body><table class="default_table"><thead>{}</thead><tbody>{}</tbody></table></body></html>'.format(
+		rows[0], ''.join(rows[1:]))
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-r', '--rows', type=int, nargs='+', default=[10000, 20000, 50000, 100000],
+	                    help="table sizes (rows) to benchmark")
+	parser.add_argument('-n', '--n_cols', type=int, default=4, help="columns per table")
+	parser.add_argument('-c', '--config', type=str, default="configs/config_pmc.json", help="config file to use")
+	args = parser.parse_args()
+
+	with open(args.config, "r") as f:
+		config = json.load(f)
+
+	print("{:>8} {:>10} {:>12}".format("rows", "seconds", "us/row"))
+	for n_rows in args.rows:
+		soup = BeautifulSoup(build_table_html(n_rows, args.n_cols), 'html.parser')
+		start = time.perf_counter()
+		table(soup, config, "benchmark.html")
+		elapsed = time.perf_counter() - start
+		print("{:>8} {:>10.2f} {:>12.1f}".format(n_rows, elapsed, elapsed / n_rows * 1e6))
+
+
+if __name__ == "__main__":
+	main()
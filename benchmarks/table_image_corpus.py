@@ -0,0 +1,197 @@
+'''
+Synthetic table image corpus with known ground truth.
+
+Renders tables with OpenCV drawing primitives: a title, a header row, body rows of labels and numbers, and a footer.
+Rows, columns, font, ruling ('full' grid, 'booktabs' rules only or 'none'), noise, skew and resolution are drawn at
+random from the given ranges. Each image PREFIX{i}_table_1.png is written with PREFIX{i}_table_1.json holding the
+text as table_image should read it.
+
+run from the repository root:
+$ python -m benchmarks.table_image_corpus -o synthetic_tables -n 50 --ruling full booktabs --skew 0 1 --seed 1
+'''
+
+import argparse
+import json
+import os
+import random
+
+import cv2
+import numpy as np
+
+
+FONTS = {
+	'simplex': cv2.FONT_HERSHEY_SIMPLEX,
+	'duplex': cv2.FONT_HERSHEY_DUPLEX,
+	'complex': cv2.FONT_HERSHEY_COMPLEX,
+	'triplex': cv2.FONT_HERSHEY_TRIPLEX,
+}
+RULINGS = ['full', 'booktabs', 'none']
+HEADER_WORDS = ['Group', 'Mean', 'SD', 'Median', 'Range', 'Cases', 'Controls', 'OR', 'HR', 'Beta', 'Weight', 'Age']
+LABEL_WORDS = ['Age', 'Sex', 'BMI', 'Smoking', 'Diabetes', 'Height', 'Income', 'Region', 'Stage', 'Dose']
+
+
+def table_text(rng, n_rows, n_cols, empty):
+	"""
+	make up the text of a table
+
+	Args:
+		rng: random.Random
+		n_rows: number of body rows
+		n_cols: number of columns
+		empty: share of body cells left empty
+
+	Returns:
+		ground truth dict with identifier, title, columns, rows and footer
+
+	"""
+	number = rng.randint(1, 9)
+	columns = ['Variable'] + rng.sample(HEADER_WORDS, n_cols - 1)
+	rows = []
+	for r in range(n_rows):
+		row = ['{} {}'.format(rng.choice(LABEL_WORDS), r + 1)]
+		for c in range(1, n_cols):
+			if rng.random() < empty:
+				row.append('')
+			elif rng.random() < 0.2:
+				row.append(str(rng.randint(1, 999)))
+			else:
+				row.append('{:.{}f}'.format(rng.uniform(0, 100), rng.choice([1, 2, 3])))
+		rows.append(row)
+	return {
+		'identifier': 'Table {}'.format(number),
+		'title': 'Characteristics of the study cohort {}'.format(rng.randint(1, 99)),
+		'columns': columns,
+		'rows': rows,
+		'footer': 'Values are mean or count.'
+	}
+
+
+def render(truth, font='simplex', ruling='full', noise=0.0, skew=0.0, scale=1.0, seed=0):
+	"""
+	draw a table
+
+	Args:
+		truth: ground truth dict from table_text
+		font: name of a Hershey font in FONTS
+		ruling: 'full', 'booktabs' or 'none'
+		noise: standard deviation of gaussian pixel noise
+		skew: rotation in degrees
+		scale: resolution, 1 is about 100 dpi
+		seed: seed of the noise
+
+	Returns:
+		image: BGR numpy array
+
+	"""
+	face = FONTS[font]
+	font_scale = 0.6 * scale
+	thickness = max(1, int(round(scale)))
+	line = max(1, int(round(scale)))
+	pad_x, pad_y, margin = int(14 * scale), int(12 * scale), int(20 * scale)
+
+	grid = [truth['columns']] + truth['rows']
+	text_h = cv2.getTextSize('Ag', face, font_scale, thickness)[0][1]
+	col_w = [max(cv2.getTextSize(row[c], face, font_scale, thickness)[0][0] for row in grid) + 2 * pad_x
+	         for c in range(len(grid[0]))]
+	row_h = text_h + 2 * pad_y + int(6 * scale)
+	title = '{}. {}'.format(truth['identifier'], truth['title'])
+	title_w = cv2.getTextSize(title, face, font_scale, thickness)[0][0]
+
+	# tables are set to the width of a page column, at least, spreading the extra space over the columns
+	extra = max(0, int(900 * scale) - sum(col_w))
+	col_w = [w + extra // len(col_w) for w in col_w]
+	width = max(sum(col_w), title_w) + 2 * margin
+	top = margin + text_h + 2 * pad_y
+	height = top + row_h * len(grid) + 2 * pad_y + text_h + margin
+	img = np.full((height, width, 3), 255, dtype=np.uint8)
+
+	black = (0, 0, 0)
+	cv2.putText(img, title, (margin, margin + text_h), face, font_scale, black, thickness, cv2.LINE_AA)
+	xs = [margin + sum(col_w[:c]) for c in range(len(col_w) + 1)]
+	ys = [top + r * row_h for r in range(len(grid) + 1)]
+	for r, row in enumerate(grid):
+		for c, text in enumerate(row):
+			cv2.putText(img, text, (xs[c] + pad_x, ys[r] + pad_y + text_h), face, font_scale, black, thickness, cv2.LINE_AA)
+	cv2.putText(img, truth['footer'], (margin, ys[-1] + 2 * pad_y + text_h), face, font_scale, black, thickness,
+	            cv2.LINE_AA)
+
+	if ruling == 'full':
+		for y in ys:
+			cv2.line(img, (xs[0], y), (xs[-1], y), black, line)
+		for x in xs:
+			cv2.line(img, (x, ys[0]), (x, ys[-1]), black, line)
+	elif ruling == 'booktabs':
+		for y in [ys[0], ys[1], ys[-1]]:
+			cv2.line(img, (xs[0], y), (xs[-1], y), black, line)
+
+	if skew:
+		rotation = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+		img = cv2.warpAffine(img, rotation, (width, height), flags=cv2.INTER_LINEAR, borderValue=(255, 255, 255))
+	if noise:
+		noisy = img.astype(np.float32) + np.random.default_rng(seed).normal(0, noise, img.shape[:2])[..., None]
+		img = np.clip(noisy, 0, 255).astype(np.uint8)
+	return img
+
+
+def generate(out_dir, n_tables, rows=(5, 15), cols=(3, 7), fonts=('simplex',), rulings=('full',), noise=(0.0, 0.0),
+             skew=(0.0, 0.0), scale=(1.0, 1.0), empty=0.05, seed=0, prefix='SYNTH'):
+	"""
+	write a corpus of table images and their ground truth
+
+	Args:
+		out_dir: directory to write to, created if missing
+		n_tables: number of tables
+		rows, cols: (min, max) number of body rows and of columns
+		fonts: font names to choose from
+		rulings: rulings to choose from
+		noise, skew, scale: (min, max) of the noise, skew and scale passed to render
+		empty: share of body cells left empty
+		seed: random seed, the same arguments and seed give the same corpus
+		prefix: file name prefix
+
+	Returns:
+		list of image file paths
+
+	"""
+	rng = random.Random(seed)
+	os.makedirs(out_dir, exist_ok=True)
+	paths = []
+	for i in range(n_tables):
+		truth = table_text(rng, rng.randint(*rows), rng.randint(*cols), empty)
+		options = {
+			'font': rng.choice(fonts),
+			'ruling': rng.choice(rulings),
+			'noise': rng.uniform(*noise),
+			'skew': rng.uniform(*skew),
+			'scale': rng.uniform(*scale),
+			'seed': rng.randrange(2 ** 32)
+		}
+		base = os.path.join(out_dir, '{}{}_table_1'.format(prefix, i))
+		cv2.imwrite(base + '.png', render(truth, **options))
+		with open(base + '.json', 'w') as f:
+			json.dump(dict(truth, render=options), f, indent=2)
+		paths.append(base + '.png')
+	return paths
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-o', '--out_dir', type=str, required=True, help="directory to write the corpus to")
+	parser.add_argument('-n', '--n_tables', type=int, default=20, help="number of tables")
+	parser.add_argument('--rows', type=int, nargs=2, default=[5, 15], help="min and max number of body rows")
+	parser.add_argument('--cols', type=int, nargs=2, default=[3, 7], help="min and max number of columns")
+	parser.add_argument('--fonts', type=str, nargs='+', choices=list(FONTS), default=['simplex'], help="fonts")
+	parser.add_argument('--ruling', type=str, nargs='+', choices=RULINGS, default=['full'], help="rulings")
+	parser.add_argument('--noise', type=float, nargs=2, default=[0, 0], help="min and max pixel noise sd")
+	parser.add_argument('--skew', type=float, nargs=2, default=[0, 0], help="min and max rotation in degrees")
+	parser.add_argument('--scale', type=float, nargs=2, default=[1, 1], help="min and max resolution, 1 is about 100 dpi")
+	parser.add_argument('--empty', type=float, default=0.05, help="share of empty body cells")
+	parser.add_argument('--seed', type=int, default=0, help="random seed")
+	args = parser.parse_args()
+	paths = generate(args.out_dir, args.n_tables, args.rows, args.cols, args.fonts, args.ruling, args.noise, args.skew,
+	                 args.scale, args.empty, args.seed)
+	print("wrote {} tables to {}".format(len(paths), args.out_dir))
+
+
+if __name__ == "__main__":
+	main()
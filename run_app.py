@@ -1,4 +1,6 @@
 import argparse
+import atexit
+import json
 import os
 import glob
 from tqdm import tqdm
@@ -6,30 +8,99 @@ import re
 import imghdr
 
 from autoCORPus import autoCORPus
+from src import bioc_json
+from src.bioc_xml import BiocXMLWriter
+from src.compressed_io import open_output
+from src.document_guard import document_guard
+from src.document_profiler import document_profiler
+from src.input_prefetcher import input_prefetcher
+from src.jsonl_corpus import jsonl_corpus
+from src.memory_monitor import memory_monitor
+from src.output_writer import output_writer, WRITE_BUFFER
+from src.sqlite_corpus import sqlite_corpus
+from src.stage_timer import stage_timer
+from src.ocr_cache import ocr_cache
 
 parser = argparse.ArgumentParser(prog='PROG')
 parser.add_argument('-f','--filepath',type=str, help="filepath for document/directory to run AC on")
 parser.add_argument('-t','--target_dir',type=str, help="target directory") #default autoCORPusOutput
 parser.add_argument('-a','--associated_data',type=str, help="directory of associated data")
-parser.add_argument('-o','--output_format',type=str, help="output format for main text, can be either JSON or XML. Does not effect tables or abbreviations")
+parser.add_argument('-o','--output_format',type=str, help="output format for main text, tables and abbreviations, can be either JSON or XML")
+parser.add_argument('--side_format',type=str, choices=['JSON', 'XML'], default='JSON', help="format of the tables and abbreviations files, JSON whatever the main text format unless XML is asked for")
+parser.add_argument('--json_format',type=str, choices=['indented', 'compact'], default='indented', help="JSON output layout: 'compact' leaves out all whitespace, making files smaller and faster to write")
+parser.add_argument('--json_encoder',type=str, choices=['json', 'auto', 'orjson'], default='json', help="JSON encoder: 'json' writes output byte for byte as before, in chunks; 'orjson' is much faster but formats some numbers differently and NaN as null; 'auto' uses orjson when installed")
+parser.add_argument('--compress',type=str, choices=['gzip', 'zstd'], help="compress every output file as it is written, adding .gz or .zst to its name. zstd needs the zstandard package. Read outputs with src.compressed_io.open_input")
+parser.add_argument('--jsonl',action='store_true', help="write the corpus as sharded JSON Lines files in the target directory, one record per article in maintext, tables and abbreviations streams, instead of files per article")
+parser.add_argument('--shard_size',type=int, default=1024, help="size in MB a JSON Lines shard is rotated at, with --jsonl")
+parser.add_argument('--jsonl_index',action='store_true', help="write an offset index next to each JSON Lines shard, so single articles can be read at random")
+parser.add_argument('--sqlite',type=str, help="SQLite database file to write articles, passages, tables and abbreviations to, instead of files per article")
+parser.add_argument('--sqlite_batch',type=int, default=100, help="articles written to the SQLite database per transaction")
+parser.add_argument('--write_queue',type=int, default=8, help="articles waiting to be written by the background output writer while the next is processed, 0 to write each article before processing the next")
+parser.add_argument('--prefetch_mb',type=int, help="MB of upcoming articles' input files read ahead on background threads while the current article is processed, 64 by default, 0 to read files when they are needed. Given, the time spent reading and waiting for reads is printed at the end")
+parser.add_argument('--prefetch_workers',type=int, default=4, help="articles whose input files are read at once by the prefetcher")
+parser.add_argument('--timing_report',type=str, help="record the wall and CPU time of each processing stage for every article and write them to this file, as CSV if it ends in .csv, otherwise as JSON with per stage percentiles and the slowest articles")
+parser.add_argument('--profile',type=str, help="directory to write a cProfile of each article's processing to, as .pstats and as collapsed stacks for flame graphs, with an aggregate profile of the whole run")
+parser.add_argument('--profile_threshold',type=float, default=0, help="seconds an article must take for its profile to be written with --profile, all articles are still added to the aggregate profile")
+parser.add_argument('--memory_report',type=str, help="JSON file to write the input size, resident set size and peak resident set size of each article to, for sizing worker memory limits")
+parser.add_argument('--tracemalloc',action='store_true', help="add the peak and retained Python allocations of each article, traced with tracemalloc, to --memory_report. Slows processing down")
+parser.add_argument('--doc_timeout',type=float, default=0, help="seconds an article may take to process before its worker process is killed and the article quarantined, 0 for no limit. Runs articles in a worker process")
+parser.add_argument('--doc_memory_mb',type=int, default=0, help="MB the resident memory of an article's worker process may grow by while processing it before it is killed and the article quarantined, 0 for no limit. Runs articles in a worker process")
+parser.add_argument('--isolate',action='store_true', help="process articles in a worker process even without --doc_timeout or --doc_memory_mb, so crashes of native code only lose the article. --profile and --memory_report then only see the main process")
+parser.add_argument('--retries',type=int, default=0, help="times an article that fails, times out or runs out of memory is tried again before it is quarantined, in a fresh worker process when articles run in worker processes")
+parser.add_argument('--quarantine',type=str, help="JSON Lines file to write the key, failed stage, error, elapsed seconds and attempts of each quarantined article to")
+parser.add_argument('--fail_fast',action='store_true', help="stop at the first article that fails instead of quarantining it and carrying on")
 parser.add_argument('-s','--start_output_at',type=str, help="name of directory within the input file path where the output should mirror the directory structure from, inclusive")
+parser.add_argument('--ocr_mode',type=str, choices=['cell', 'image'], default='cell', help="table image OCR: 'cell' runs tesseract per cell, 'image' once per image with per cell fallback")
+parser.add_argument('--ocr_workers',type=int, default=1, help="number of tesseract processes to run at once for table images")
+parser.add_argument('--ocr_timeout',type=float, default=0, help="seconds before a single tesseract call is abandoned, 0 for no limit")
+parser.add_argument('--ocr_engine',type=str, choices=['tesseract', 'tesserocr', 'stub'], default='tesseract', help="OCR engine for table images: tesseract command line, tesseract in process through tesserocr, or a deterministic stub for testing")
+parser.add_argument('--ocr_batch',type=int, default=1, help="number of table image cells read by one OCR engine call")
+parser.add_argument('--ocr_cache',type=str, help="directory of the OCR result cache for table images, no cache if not given")
+parser.add_argument('--ocr_cache_size',type=int, default=1024, help="maximum size of the OCR result cache in MB")
+parser.add_argument('--image_preprocess',type=str, choices=['full', 'lean'], default='full', help="table image preprocessing: 'lean' works in grayscale and detects cells on a downscaled copy of large scans")
+parser.add_argument('--image_max_side',type=int, default=2000, help="longest side in pixels used for cell detection with --image_preprocess lean")
+parser.add_argument('--blank_threshold',type=float, default=-1.0, help="table image cells with at most this share of ink, or only specks and line fragments, are left empty without OCR, e.g. 0 for cells without ink. Negative, the default, to OCR every cell")
+parser.add_argument('--ocr_report',type=str, help="JSON file to write the number of cells, OCR calls and skipped blank cells per table image to")
+parser.add_argument('--cell_detector',type=str, choices=['contour', 'grid'], default='contour', help="table image cell detection: 'grid' reads the cells of ruled tables from their ruling lines, falling back to 'contour'")
 
-group = parser.add_mutually_exclusive_group()
-group.add_argument("-c", "--config", type=str, help="filepath for configuration JSON file")
-group.add_argument("-d", "--config_dir", type=str, help="directory of configuration JSON files")
+parser.add_argument("-c", "--config", type=str, required=True, help="filepath for configuration JSON file")
 
 
 args = parser.parse_args()
 file_path = args.filepath
 target_dir = args.target_dir if args.target_dir else "autoCORPus_output"
 config = args.config
-config_dir = args.config_dir
 associated_data = args.associated_data
 output_format = args.output_format if args.output_format else "JSON"
+json_indent = 2 if args.json_format == "indented" else None
 mirror_from = args.start_output_at if args.start_output_at else ""
+prefetch_mb = args.prefetch_mb if args.prefetch_mb is not None else 64
+table_image_options = {
+	"ocr_mode": args.ocr_mode,
+	"ocr_workers": args.ocr_workers,
+	"ocr_timeout": args.ocr_timeout,
+	"ocr_engine": args.ocr_engine,
+	"ocr_batch": args.ocr_batch,
+	"ocr_cache": ocr_cache(args.ocr_cache, args.ocr_cache_size * 1024 ** 2) if args.ocr_cache else None,
+	"preprocess": args.image_preprocess,
+	"max_side": args.image_max_side,
+	"cell_detector": args.cell_detector,
+	"blank_threshold": args.blank_threshold,
+	"ocr_report": {}
+}
 
 if not mirror_from in file_path and not mirror_from == "":
 	exit("-s value must be a directory found within the specified input file path")
+if args.jsonl and not output_format == "JSON":
+	exit("--jsonl writes JSON, it cannot be used with -o XML")
+# a bad config fails every article, so it is checked once here rather than quarantining them all
+try:
+	with open(config, "r") as f:
+		json.load(f)
+except (OSError, ValueError) as e:
+	exit("cannot read the configuration file {}: {}".format(config, e))
+database = sqlite_corpus(args.sqlite, args.sqlite_batch) if args.sqlite else None
+corpus = jsonl_corpus(target_dir, args.shard_size * 1024 ** 2, args.jsonl_index, args.json_encoder, args.compress) if args.jsonl else None
 
 def get_file_type(file_path):
 	'''
@@ -129,17 +200,43 @@ def read_file_structure(file_path):
 		print(F"{file_path} does not exist")
 	pass
 
-structure = read_file_structure(file_path)
-pbar = tqdm(structure.keys())
-for key in pbar:
-	pbar.set_postfix(
-		{
-			"file": key + "*",
-			"linked_tables": len(structure[key]['linked_tables']),
-			"table_images": len(structure[key]['table_images'])
-		}
-	)
-	AC = autoCORPus(config, main_text=structure[key]['main_text'], linked_tables=structure[key]['linked_tables'], table_images=structure[key]['table_images'])
+def input_paths(key):
+	'''
+	:param key: base file name
+	:return: paths of all input files of the article
+	'''
+	return ([structure[key]['main_text']] if structure[key]['main_text'] else []) + structure[key]['linked_tables'] + structure[key]['table_images']
+
+def document_id(key):
+	'''
+	:param key: base file name
+	:return: id of the article in a corpus, the base file name relative to the input directory so articles of the
+	same name in different subdirectories are kept apart
+	'''
+	if os.path.isdir(file_path):
+		return os.path.relpath(key, file_path).replace(os.sep, "/")
+	return key.split("/")[-1]
+
+def write_outputs(key, AC, bioc, tables):
+	'''
+	writes the outputs of an article
+	:param key: base file name
+	:param AC: autoCORPus object of the article
+	:param bioc: BioC dict of the main text
+	:param tables: BioC dict of the tables, None if the article has none
+	'''
+	if database:
+		database.write(document_id(key), bioc, tables,
+		               AC.abbreviations if structure[key]["main_text"] else None, structure[key]["main_text"] or None)
+	if corpus:
+		doc_id = document_id(key)
+		if structure[key]["main_text"]:
+			corpus.write("maintext", doc_id, bioc)
+			corpus.write("abbreviations", doc_id, AC.abbreviations)
+		if AC.has_tables:
+			corpus.write("tables", doc_id, tables)
+	if corpus or database:
+		return
 
 	out_dir = structure[key]["out_dir"]
 	new_out_dir = []
@@ -154,24 +251,140 @@ for key in pbar:
 		out_dir = "/".join(new_out_dir)
 	out_dir = target_dir + "/" + out_dir
 
+	writer.makedirs(out_dir)
+	out_base = out_dir + "/" + key.split("/")[-1]
+	if structure[key]["main_text"]:
+		write_collection(out_base + "_bioc", bioc, output_format == "XML")
+		write_collection(out_base + "_abbreviations", AC.abbreviations, args.side_format == "XML")
+	if AC.has_tables:
+		write_collection(out_base + "_tables", tables, args.side_format == "XML")
 
+def write_collection(path, collection, xml):
+	'''
+	writes a BioC collection as JSON, or as XML streamed to the file passage by passage
+	:param path: output file path without the .json or .xml extension
+	:param collection: BioC dict
+	:param xml: write XML rather than JSON
+	'''
+	if xml:
+		with open_output(path + ".xml", args.compress, text=True, buffering=WRITE_BUFFER) as outfp:
+			BiocXMLWriter(outfp).write_collection(collection)
+	else:
+		with open_output(path + ".json", args.compress, buffering=WRITE_BUFFER) as outfp:
+			bioc_json.write(collection, outfp, json_indent, args.json_encoder)
 
-	if not os.path.exists(out_dir):
-		os.makedirs(out_dir)
-	if structure[key]["main_text"]:
-		if output_format == "JSON":
-			with open(out_dir + "/" + key.split("/")[-1] + "_bioc.json", "w") as outfp:
-				outfp.write(AC.main_text_to_bioc_json())
-		else:
-			with open(out_dir + "/" + key.split("/")[-1] + "_bioc.xml", "w") as outfp:
-				outfp.write(AC.main_text_to_bioc_xml())
-		with open(out_dir + "/" + key.split("/")[-1] + "_abbreviations.json", "w") as outfp:
-			outfp.write(AC.abbreviations_to_bioc_json())
+def format_and_write(key, AC):
+	'''
+	formats and writes the outputs of an article
+	:param key: base file name
+	:param AC: autoCORPus object of the article
+	'''
+	bioc = AC.to_bioc() if structure[key]["main_text"] else None
+	tables = AC.tables_to_bioc() if AC.has_tables else None
+	with timer.stage("serialise_write"):
+		write_outputs(key, AC, bioc, tables)
 
-	# AC does not support the conversion of tables or abbreviations to the XML format
-	if AC.has_tables:
-		with open(out_dir + "/" + key.split("/")[-1] + "_tables.json", "w") as outfp:
-			outfp.write(AC.tables_to_bioc_json())
+def write_article(key, AC):
+	'''
+	formats and writes the outputs of an article, run on the output writer thread. The article is quarantined if
+	this fails
+	:param key: base file name
+	:param AC: autoCORPus object of the article
+	'''
+	with timer.document(key):
+		guard.protect(key, format_and_write, key, AC)
 
-	pass
+def process_article(key, file_data):
+	'''
+	processes an article, run by the document guard, in a worker process when articles are isolated in processes
+	:param key: base file name
+	:param file_data: dict of the article's input files already read, None to read them when needed
+	:return: autoCORPus object of the article, its stage timings, the OCR report of its table images and the change in
+		the OCR cache counters, returned so they reach the main process from a worker process
+	'''
+	cache = table_image_options["ocr_cache"]
+	cache_before = cache.counts() if cache else {}
+	with timer.document(key):
+		AC = autoCORPus(config, main_text=structure[key]['main_text'], linked_tables=structure[key]['linked_tables'], table_images=structure[key]['table_images'], table_image_options=table_image_options, file_data=file_data, timer=timer)
+	ocr_report = table_image_options["ocr_report"]
+	cache_counts = {name: count - cache_before[name] for name, count in cache.counts().items()} if cache else {}
+	return AC, timer.pop_document(key), {path: ocr_report[path] for path in structure[key]['table_images'] if path in ocr_report}, cache_counts
+
+structure = read_file_structure(file_path)
+guard = document_guard(process_article, args.doc_timeout, args.doc_memory_mb * 1024 ** 2, args.retries, args.isolate,
+                       args.quarantine, args.fail_fast)
+timer = stage_timer(enabled=bool(args.timing_report), on_stage=guard.on_stage)
+# worker processes are forked from a process started here, before the writer and prefetch threads
+guard.start()
+writer = output_writer(args.write_queue)
+memory = memory_monitor(enabled=bool(args.memory_report), trace=args.tracemalloc)
+profiler = document_profiler(args.profile, args.profile_threshold, enabled=bool(args.profile))
+# queued outputs are still written if processing stops with an error
+atexit.register(writer.close)
+if prefetch_mb > 0:
+	prefetch = input_prefetcher(((key, input_paths(key)) for key in structure), prefetch_mb * 1024 ** 2, args.prefetch_workers)
+else:
+	prefetch = None
+pbar = tqdm(prefetch if prefetch else ((key, None) for key in structure), total=len(structure))
+for key, file_data in pbar:
+	pbar.set_postfix(
+		{
+			"file": key + "*",
+			"linked_tables": len(structure[key]['linked_tables']),
+			"table_images": len(structure[key]['table_images'])
+		}
+	)
+	with timer.document(key), profiler.profile(key), memory.document(key, input_paths(key)):
+		result = guard.process(key, file_data)
+	if result is None:
+		# quarantined
+		continue
+	AC, stages, ocr_images, cache_counts = result
+	AC.timer = timer
+	timer.add_document(key, stages)
+	if guard.processes and table_image_options["ocr_cache"]:
+		# counted by the copy of the cache in the worker process
+		table_image_options["ocr_cache"].add_counts(cache_counts)
+	table_image_options["ocr_report"].update(ocr_images)
+	writer.submit(write_article, key, AC)
 
+writer.close()
+guard.close()
+if guard.quarantined or guard.recovered:
+	print("{} articles quarantined{}, {} recovered by retrying".format(
+		guard.quarantined, ", see " + args.quarantine if args.quarantine else "", guard.recovered))
+if args.memory_report:
+	memory.close()
+	memory.write_report(args.memory_report)
+	summary = memory.summary()
+	print("Memory report written to {}, peak RSS {:.1f} MB".format(args.memory_report, summary["rss_peak_max"] / 1024 ** 2))
+if args.profile:
+	profiler.close()
+	print("Profiles of {} of {} articles and of the whole run written to {}".format(
+		profiler.profiles_written, profiler.documents, args.profile))
+if args.timing_report:
+	timer.write_report(args.timing_report)
+	slowest = timer.summary(1)["slowest"]
+	print("Stage timing report written to {}{}".format(args.timing_report, ", slowest document {} ({:.2f} s)".format(
+		slowest[0]["document"], slowest[0]["wall"]) if slowest else ""))
+if prefetch and args.prefetch_mb is not None:
+	stats = prefetch.stats()
+	print("Input prefetch: {} files, {:.1f} MB, {:.2f} s reading, {:.2f} s waiting for reads, {:.2f} s processing".format(
+		stats["files"], stats["bytes"] / 1024 ** 2, stats["read_seconds"], stats["io_wait_seconds"], stats["cpu_seconds"]))
+if database:
+	database.close()
+	print("SQLite corpus: {} articles written to {}".format(database.records, args.sqlite))
+if corpus:
+	corpus.close()
+	print("JSON Lines corpus: {} records written to {}".format(corpus.records, target_dir))
+if table_image_options["ocr_report"]:
+	ocr_report = table_image_options["ocr_report"]
+	print("Table images: {} cells, {} OCR calls, {} blank cells skipped".format(
+		sum(i["cells"] for i in ocr_report.values()),
+		sum(i["ocr_calls"] for i in ocr_report.values()),
+		sum(i["blank_cells_skipped"] for i in ocr_report.values())))
+	if args.ocr_report:
+		with open(args.ocr_report, "w") as outfp:
+			json.dump(ocr_report, outfp, indent=2)
+if table_image_options["ocr_cache"]:
+	print("OCR cache: {}".format(table_image_options["ocr_cache"].stats()))
@@ -381,7 +381,7 @@ class abbreviations:
 		paragraphs = main_text['paragraphs']
 		all_abbreviations = {}
 		for paragraph in paragraphs:
-			maintext = paragraph['body']
+			maintext = paragraph.body
 			pairs = self.__extract_abbreviation(maintext)
 			all_abbreviations.update(pairs)
 
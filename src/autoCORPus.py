@@ -1,3 +1,4 @@
+import io
 import json
 import sys
 from bs4 import BeautifulSoup
@@ -14,42 +15,27 @@ import logging
 from src.abbreviation import abbreviations
 from src.table import table
 from src.table_image import table_image
+from src.table_scanner import table_scanner
 from src.bioc_formatter import BiocFormatter
-from bioc import loads, dumps, BioCFileType
-
-def handle_path(func):
-	def inner_function(*args, **kwargs):
-		try:
-			return func(*args, **kwargs)
-		except IOError as io:
-			print(io)
-			sys.exit()
-		except OSError as exc:
-			print(exc)
-			sys.exit()
-		except Exception as e:
-			print(e)
-			sys.exit()
-		pass
-	return inner_function
-
-
+from src.stage_timer import NO_TIMER
+from src.bioc_model import passage, section_type
+from src import bioc_json, bioc_xml
 
 class autoCORPus:
 	'''
+	extracts the main text, abbreviations and tables of an article. main_text holds the title and, under
+	'paragraphs', a list of bioc_model.passage objects rather than dicts, to keep the memory of large articles down;
+	to_dict gives them as dicts, as before. tables is a bioc_model.collection, None if no tables were looked for.
 	'''
-	@handle_path
 	def __read_config(self, config_path):
 		with open(config_path, "r") as f:
 			## TODO: validate config file here if possible
 			return json.load(f)
 
-	@handle_path
 	def __import_file(self, file_path):
 		with open(file_path, "r") as f:
 			return f.read(), file_path
 
-	@handle_path
 	def __handle_target_dir(self, target_dir):
 		if not os.path.exists(target_dir):
 			os.makedirs(target_dir)
@@ -58,15 +44,28 @@ class autoCORPus:
 	def __validate_infile(self):
 		pass
 
-	def __soupify_infile(self, fpath):
-		try:
+	def __read_infile(self, fpath):
+		'''
+		:return: text of the file, from the bytes already read in file_data if there
+		'''
+		with self.timer.stage("file_read"):
+			if fpath in self.file_data:
+				# decoded as open() would, with the same encoding and newline handling
+				return io.TextIOWrapper(io.BytesIO(self.file_data[fpath])).read()
 			with open(fpath, "r") as fp:
-				soup = BeautifulSoup(fp.read(), 'html.parser')
-				for e in soup.find_all(attrs={'style': ['display:none', 'visibility:hidden']}):
-					e.extract()
-				return soup
-		except Exception as e:
-			print(e)
+				return fp.read()
+
+	def __soupify_infile(self, fpath, table_config=None):
+		html = self.__read_infile(fpath)
+		with self.timer.stage("soup_parse"):
+			if table_config:
+				# only the table subtrees of the page are needed, skip building the rest of the tree
+				html = table_scanner(table_config).reduce(html)
+			soup = BeautifulSoup(html, 'html.parser')
+		with self.timer.stage("hidden_strip"):
+			for e in soup.find_all(attrs={'style': ['display:none', 'visibility:hidden']}):
+				e.extract()
+		return soup
 
 	def __clean_text(self, result):
 		'''
@@ -85,7 +84,7 @@ class autoCORPus:
 
 		# Identify unique section headings and the index of their first appearance
 		idx_section = []
-		section_headings = set([i['section_heading'] for i in result['paragraphs']])
+		section_headings = set([i.section_heading for i in result['paragraphs']])
 
 		for i in range(len(section_headings)):
 			try:
@@ -95,34 +94,25 @@ class autoCORPus:
 			except IndexError:
 				idx_section_last = len(result['paragraphs'])
 
-			p = result['paragraphs'][idx_section[i]+1]['body']
+			p = result['paragraphs'][idx_section[i]+1].body
 			for idx_subsection in range(idx_section[i]+1, idx_section_last):
-				if result['paragraphs'][idx_subsection]['body'] in result['paragraphs'][idx_section[i]]['body']:
-					result['paragraphs'][idx_section[i]]['body'] = result['paragraphs'][idx_section[i]]['body'].replace(
-						result['paragraphs'][idx_subsection]['body'], '')
+				if result['paragraphs'][idx_subsection].body in result['paragraphs'][idx_section[i]].body:
+					result['paragraphs'][idx_section[i]].body = result['paragraphs'][idx_section[i]].body.replace(
+						result['paragraphs'][idx_subsection].body, '')
 
-				if (idx_section[i]+1 != idx_subsection) and (p in result['paragraphs'][idx_subsection]['body']):
-					result['paragraphs'][idx_subsection]['body'] = result['paragraphs'][idx_subsection]['body'].replace(
+				if (idx_section[i]+1 != idx_subsection) and (p in result['paragraphs'][idx_subsection].body):
+					result['paragraphs'][idx_subsection].body = result['paragraphs'][idx_subsection].body.replace(
 						p, '')
 			for idx_subsection in range(idx_section[i]+1, idx_section_last):
-				if result['paragraphs'][idx_subsection]['subsection_heading'] == result['paragraphs'][idx_section[i]]['subsection_heading']:
-					result['paragraphs'][idx_section[i]]['subsection_heading'] = ''
+				if result['paragraphs'][idx_subsection].subsection_heading == result['paragraphs'][idx_section[i]].subsection_heading:
+					result['paragraphs'][idx_section[i]].subsection_heading = ''
 		return result
 
 
 	def __get_keywords(self, soup, config):
 
-		keywordSection = {
-			"section_heading": "keywords",
-			"subsection_heading": "",
-			"body": soup.find(config["keywords"]["name"], config["keywords"]["attrs"]).get_text(),
-			"section_type": [
-				{
-					"IAO_term": "keywords section",
-					"IAO_id": "IAO:0000630"
-				}
-			]
-		}
+		keywordSection = passage("keywords", "", soup.find(config["keywords"]["name"], config["keywords"]["attrs"]).get_text(),
+		                         section_type([{"IAO_term": "keywords section", "IAO_id": "IAO:0000630"}]))
 		return [keywordSection]
 
 	def __extract_text(self, soup, config):
@@ -153,7 +143,7 @@ class autoCORPus:
 			maintext = []
 		sections = soup.find_all(config['sections']['name'], config['sections']['attrs'])
 		for sec in sections:
-			maintext.extend(section(config, sec).to_dict())
+			maintext.extend(section(config, sec, self.timer).to_dict())
 		# filter out the sections which do not contain any info
 		filteredText = []
 		[filteredText.append(x) for x in maintext if x]
@@ -169,28 +159,47 @@ class autoCORPus:
 	def __set_unknown_section_headings(self, uniqueText):
 		paper = {}
 		for para in uniqueText:
-			paper[para['section_heading']] = [x['IAO_term'] for x in para['section_type']]
-		mapping_dict_with_DAG = assgin_heading_by_DAG(paper)
-		for i, para in enumerate(uniqueText):
-			if para['section_heading'] in mapping_dict_with_DAG.keys():
-				if para['section_type'] == []:
-					uniqueText[i]['section_type'] = mapping_dict_with_DAG[para['section_heading']]
+			paper[para.section_heading] = [x['IAO_term'] for x in para.section_type]
+		with self.timer.stage("dag_assignment"):
+			mapping_dict_with_DAG = assgin_heading_by_DAG(paper)
+		for para in uniqueText:
+			if para.section_heading in mapping_dict_with_DAG.keys():
+				if not para.section_type:
+					para.section_type = section_type(mapping_dict_with_DAG[para.section_heading])
 		return uniqueText
 
-	def __handle_html(self, file_path, config):
+	def __release(self, soup):
 		'''
-		handles common HTML processing elements across main_text and linked_tables (creates soup and parses tables)
+		destroy a parse tree once it is no longer needed, rather than leave its reference cycles to the garbage collector
+		'''
+		with self.timer.stage("soup_release"):
+			if soup is not None:
+				# decomposing the BeautifulSoup object alone does not reach its children with every bs4 version
+				for child in list(soup.contents):
+					child.decompose()
+				soup.decompose()
+
+	def __handle_html(self, file_path, config, tables_only=False):
+		'''
+		handles common HTML processing elements across main_text and linked_tables (creates soup and parses tables). The
+		soup is released if table extraction fails, otherwise the caller must release it
+		:param tables_only: only parse the parts of the file needed for table extraction
 		:return: soup object
 		'''
 		self.file_name = file_path.split("/")[-1]
-		soup = self.__soupify_infile(file_path)
-		if self.tables == {}:
-			self.tables = table(soup, config, file_path).to_dict()
-		else:
-			self.tables["documents"].extend(table(soup, config, file_path).to_dict()["documents"])
+		soup = self.__soupify_infile(file_path, config if tables_only else None)
+		try:
+			with self.timer.stage("table_extraction"):
+				if self.tables is None:
+					self.tables = table(soup, config, file_path).to_collection()
+				else:
+					self.tables.documents.extend(table(soup, config, file_path).to_collection().documents)
+		except BaseException:
+			self.__release(soup)
+			raise
 		return soup
 
-	def __init__(self, config_path, main_text = None, linked_tables = None, table_images = None, associated_data_path=None):
+	def __init__(self, config_path, main_text = None, linked_tables = None, table_images = None, associated_data_path=None, table_image_options=None, file_data=None, timer=None):
 		'''
 
 		:param config_path: path to the config file to be used
@@ -198,59 +207,98 @@ class autoCORPus:
 		:param linked_tables: list of linked table file paths to be included in this run (HTML files only)
 		:param table_images: list of table image file paths to be included in this run (JPEG or PNG files only)
 		:param associated_data_path: this still needs sorting
+		:param table_image_options: dict of keyword arguments for table image processing (see table_image)
+		:param file_data: dict of file path to the bytes of the file, already read, for input files read ahead
+		:param timer: stage_timer recording the time of each processing stage, none by default
 		'''
+		self.timer = timer or NO_TIMER
 		# handle common
-		config = self.__read_config(config_path)
+		with self.timer.stage("config_load"):
+			config = self.__read_config(config_path)
 		self.file_path = main_text
 		self.main_text = {}
-		self.tables={}
+		# bioc_model.collection of the tables, converted to BioC when written
+		self.tables = None
 		self.abbreviations = {}
 		self.has_tables = False
+		self.file_data = file_data or {}
 
 		# handle main_text
 		if main_text:
 			soup = self.__handle_html(main_text, config)
-			self.main_text = self.__extract_text(soup, config)
 			try:
-				self.abbreviations = abbreviations(self.main_text, soup, config, main_text).to_dict()
-			except Exception as e:
-				print(e)
-			if not self.tables["documents"] == []:
+				with self.timer.stage("section_extraction"):
+					self.main_text = self.__extract_text(soup, config)
+				try:
+					with self.timer.stage("abbreviations"):
+						self.abbreviations = abbreviations(self.main_text, soup, config, main_text).to_dict()
+				except Exception as e:
+					print(e)
+			finally:
+				self.__release(soup)
+			if self.tables.documents:
 				self.has_tables = True
 		if linked_tables:
 			for table_file in linked_tables:
-				soup = self.__handle_html(table_file, config)
-			if not self.tables["documents"] == []:
+				self.__release(self.__handle_html(table_file, config, tables_only=True))
+			if self.tables.documents:
 				self.has_tables = True
 		if table_images:
-			self.tables = table_image(table_images).to_dict()
-			if not self.tables["documents"] == []:
+			with self.timer.stage("table_extraction"):
+				self.tables = table_image(table_images, image_data=self.file_data, **(table_image_options or {})).to_collection()
+			if self.tables.documents:
 				self.has_tables = True
+		# the input files read ahead are not needed once processed
+		self.file_data = {}
+
+	def __getstate__(self):
+		# the timer belongs to the process the object was made in
+		state = dict(self.__dict__)
+		del state["timer"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.timer = NO_TIMER
+
+	def __tables_dict(self):
+		# an empty dict, as before, when no tables were looked for
+		return self.tables.as_dict() if self.tables is not None else {}
 
 	def to_bioc(self):
-		return BiocFormatter(self).to_dict()
+		with self.timer.stage("bioc_format"):
+			return BiocFormatter(self).to_dict()
+
+	def tables_to_bioc(self):
+		with self.timer.stage("bioc_format"):
+			return self.__tables_dict()
 
 	def main_text_to_bioc_json(self, indent=2):
-		return BiocFormatter(self).to_json(indent)
+		return bioc_json.dumps(BiocFormatter(self).to_dict(), indent)
 
 	def main_text_to_bioc_xml(self):
-		collection = loads(BiocFormatter(self).to_json(2), BioCFileType.BIOC_JSON)
-		return dumps(collection, BioCFileType.BIOC_XML)
+		return bioc_xml.dumps(BiocFormatter(self).to_dict())
 
 	def tables_to_bioc_json(self, indent=2):
-		return json.dumps(self.tables, ensure_ascii=False, indent=indent)
+		return bioc_json.dumps(self.__tables_dict(), indent)
 
 	def abbreviations_to_bioc_json(self, indent=2):
-		return json.dumps(self.abbreviations, ensure_ascii=False, indent=indent)
+		return bioc_json.dumps(self.abbreviations, indent)
+
+	def tables_to_bioc_xml(self):
+		return bioc_xml.dumps(self.__tables_dict())
+
+	def abbreviations_to_bioc_xml(self):
+		return bioc_xml.dumps(self.abbreviations)
 
 	def to_json(self, indent=2):
 		return json.dumps(to_dict(), ensure_ascii=False, indent=indent)
 
 	def to_dict(self):
 		return {
-			"main_text": self.main_text,
+			"main_text": dict(self.main_text, paragraphs=[paragraph.to_dict() for paragraph in self.main_text.get('paragraphs', [])]),
 			"abbreviations": self.abbreviations,
-			"tables": self.tables
+			"tables": self.__tables_dict()
 		}
 
 if __name__ == "__main__":
@@ -11,13 +11,13 @@ class BiocDocument:
 		for passage in dataStore.main_text['paragraphs']:
 			passage_obj = BioCPassage(passage, offset)
 			passages.append(passage_obj.as_dict())
-			offset += len(passage['body'])
-			if passage['subsection_heading'] not in seen_headings:
-				offset += len(passage['subsection_heading'])
-				seen_headings.append(passage['subsection_heading'])
-			if passage['section_heading'] not in seen_headings:
-				offset += len(passage['section_heading'])
-				seen_headings.append(passage['section_heading'])
+			offset += len(passage.body)
+			if passage.subsection_heading not in seen_headings:
+				offset += len(passage.subsection_heading)
+				seen_headings.append(passage.subsection_heading)
+			if passage.section_heading not in seen_headings:
+				offset += len(passage.section_heading)
+				seen_headings.append(passage.section_heading)
 			# TODO: include section_title + subsection in offset
 		return passages
 
@@ -0,0 +1,101 @@
+import io
+import json
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+# characters gathered before each write to the file
+CHUNK_SIZE = 1 << 16
+# 'json' is the default, 'auto' uses orjson when installed
+ENCODERS = ['json', 'auto', 'orjson']
+
+
+def is_text(fp):
+	return isinstance(fp, io.TextIOBase)
+
+
+def orjson_option(indent, encoder):
+	"""
+	Returns:
+		orjson option for the indent, or None if orjson is not to be used or cannot write it
+	"""
+	if encoder not in ENCODERS:
+		raise ValueError("unknown JSON encoder: {}".format(encoder))
+	if encoder == 'orjson' and orjson is None:
+		raise ImportError("the orjson JSON encoder needs the orjson package: pip install orjson")
+	if encoder == 'json' or orjson is None or indent not in (None, 2):
+		return None
+	option = orjson.OPT_NON_STR_KEYS
+	if indent == 2:
+		option |= orjson.OPT_INDENT_2
+	return option
+
+
+def json_encoder(indent):
+	return json.JSONEncoder(ensure_ascii=False, indent=indent, separators=(',', ':') if indent is None else None)
+
+
+def write_chunks(chunks, fp):
+	"""
+	write strings to a file, gathered into writes of about CHUNK_SIZE characters
+	"""
+	text = is_text(fp)
+	pending = []
+	size = 0
+	for chunk in chunks:
+		pending.append(chunk)
+		size += len(chunk)
+		if size >= CHUNK_SIZE:
+			fp.write(''.join(pending) if text else ''.join(pending).encode('utf-8'))
+			pending = []
+			size = 0
+	if pending:
+		fp.write(''.join(pending) if text else ''.join(pending).encode('utf-8'))
+
+
+def write(obj, fp, indent=2, encoder='json'):
+	"""
+	write obj as JSON to a file. Indented, the json encoder writes it in chunks of CHUNK_SIZE characters as it is
+	encoded, so the whole text is never held in memory; only its pure Python encoder indents, so streaming costs
+	nothing. Compact output is encoded whole by the much faster C encoder and written in slices. orjson, which must be
+	asked for, is faster still but also encodes the whole text, only writes an indent of 2 or compact output, and
+	formats some numbers differently (1.2e-05 is written 0.000012) and NaN as null.
+
+	Args:
+		obj: BioC dict
+		fp: text or binary file object, binary files are written UTF-8
+		indent: 2 or another number of spaces, None for compact output without whitespace
+		encoder: 'json', 'orjson' or 'auto' for orjson when installed
+
+	"""
+	option = orjson_option(indent, encoder)
+	if option is not None:
+		try:
+			data = orjson.dumps(obj, option=option)
+		except orjson.JSONEncodeError:
+			# e.g. integers over 64 bits, left to json
+			data = None
+		if data is not None:
+			fp.write(data.decode('utf-8') if is_text(fp) else data)
+			return
+	if indent is None:
+		data = json_encoder(None).encode(obj)
+		write_chunks((data[start:start + CHUNK_SIZE] for start in range(0, len(data), CHUNK_SIZE)), fp)
+	else:
+		write_chunks(json_encoder(indent).iterencode(obj), fp)
+
+
+def dumps(obj, indent=2, encoder='json'):
+	"""
+	Returns:
+		obj as a JSON string, see write
+	"""
+	option = orjson_option(indent, encoder)
+	if option is not None:
+		try:
+			return orjson.dumps(obj, option=option).decode('utf-8')
+		except orjson.JSONEncodeError:
+			pass
+	return json_encoder(indent).encode(obj)
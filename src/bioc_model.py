@@ -0,0 +1,200 @@
+from datetime import datetime
+
+# interned IAO records and section types, shared by every passage of the same type
+IAO_RECORDS = {}
+SECTION_TYPES = {}
+
+
+def iao_record(record):
+	"""
+	Args:
+		record: dict of an IAO record, such as {"IAO_term": ..., "IAO_id": ...}
+
+	Returns:
+		the shared dict equal to record, which must not be changed
+	"""
+	key = tuple(record.items())
+	shared = IAO_RECORDS.get(key)
+	if shared is None:
+		shared = IAO_RECORDS.setdefault(key, dict(record))
+	return shared
+
+
+def section_type(records):
+	"""
+	Args:
+		records: IAO records of a passage
+
+	Returns:
+		shared tuple of the shared records
+	"""
+	key = tuple(tuple(record.items()) for record in records)
+	shared = SECTION_TYPES.get(key)
+	if shared is None:
+		shared = SECTION_TYPES.setdefault(key, tuple(iao_record(record) for record in records))
+	return shared
+
+
+TITLE = section_type([{"IAO_term": "document title", "IAO_id": "IAO:0000305"}])
+TABLE_TITLE = section_type([{"type": "table_title", "IAO_name": "document title", "IAO_id": "IAO:0000305"}])
+TABLE_CAPTION = section_type([{"type": "table_caption", "IAO_name": "caption", "IAO_id": "IAO:0000304"}])
+TABLE = section_type([{"type": "table", "IAO_name": "table", "IAO_id": "IAO:0000306"}])
+TABLE_FOOTER = section_type([{"type": "table_footer", "IAO_name": "caption", "IAO_id": "IAO:0000304"}])
+
+
+def text_passage(offset, section_type, text):
+	"""
+	Returns:
+		BioC dict of a passage of text
+	"""
+	return {
+		"offset": offset,
+		"infons": {"section_type": list(section_type)},
+		"text": text,
+		"sentences": [],
+		"annotations": [],
+		"relations": []
+	}
+
+
+class passage:
+	'''
+	a paragraph of the main text, converted to a BioC passage by BioCPassage
+	'''
+	__slots__ = ('section_heading', 'subsection_heading', 'body', 'section_type', 'infons')
+
+	def __eq__(self, other):
+		if not isinstance(other, passage):
+			return NotImplemented
+		return (self.body == other.body and self.section_heading == other.section_heading and
+		        self.subsection_heading == other.subsection_heading and self.section_type == other.section_type and
+		        (self.infons or {}) == (other.infons or {}))
+
+	__hash__ = None
+
+	def to_dict(self):
+		"""
+		Returns:
+			dict of the paragraph, with the headings, body, section type and other infons
+		"""
+		paragraph = {
+			"section_heading": self.section_heading,
+			"subsection_heading": self.subsection_heading,
+			"body": self.body,
+			"section_type": list(self.section_type)
+		}
+		if self.infons:
+			paragraph.update(self.infons)
+		return paragraph
+
+	def __init__(self, section_heading, subsection_heading, body, section_type, infons=None):
+		'''
+		:param section_heading: heading of the section, "" if none
+		:param subsection_heading: heading of the subsection, "" if none
+		:param body: text of the paragraph
+		:param section_type: tuple of IAO records from section_type
+		:param infons: dict of further infons of the passage, None if none
+		'''
+		self.section_heading = section_heading
+		self.subsection_heading = subsection_heading
+		self.body = body
+		self.section_type = section_type
+		self.infons = infons
+
+
+class table_document:
+	'''
+	a table as a BioC document. The cells are kept as the rows of values of the table, and only become BioC dicts,
+	with their ids and the passage offsets, in as_dict.
+	'''
+	__slots__ = ('file', 'id', 'cell_id', 'title', 'caption', 'columns', 'sections', 'footer')
+
+	def as_dict(self):
+		"""
+		Returns:
+			BioC dict of the table, with passages for the title, caption, table and footer
+		"""
+		passages = [text_passage(0, TABLE_TITLE, self.title)]
+		offset = len(self.title)
+		if self.caption is not None:
+			passages.append(text_passage(offset, TABLE_CAPTION, ". ".join(self.caption)))
+			offset += len("".join(self.caption))
+		table_offset = offset
+		row_id = 0
+		results_section = []
+		for section_name, rows in self.sections:
+			results_rows = []
+			for row in rows:
+				results_row = []
+				for col_id, value in enumerate(row):
+					results_row.append({"id": "{}.{}.{}".format(self.cell_id, row_id, col_id), "text": value})
+					offset += len(str(value))
+				results_rows.append(results_row)
+				row_id += 1
+			results_section.append({"section_title_1": section_name, "results_rows": results_rows})
+		passages.append({
+			"offset": table_offset,
+			"infons": {"section_type": list(TABLE)},
+			"columns": self.columns,
+			"results_section": results_section,
+			"sentences": [],
+			"annotations": [],
+			"relations": []
+		})
+		if self.footer is not None:
+			passages.append(text_passage(offset, TABLE_FOOTER, ". ".join(self.footer)))
+		return {
+			"file": self.file,
+			"id": self.id,
+			"infons": {},
+			"passages": passages,
+			"annotations": [],
+			"relations": []
+		}
+
+	def __init__(self, file, id, cell_id, title, caption, columns, sections, footer):
+		'''
+		:param file: file name of the table
+		:param id: id of the table document
+		:param cell_id: start of the cell ids, which are {cell_id}.{row}.{column} with rows counted across sections
+		:param title: title of the table
+		:param caption: list of the caption texts, None if the table has no caption passage
+		:param columns: column headers
+		:param sections: list of (section name, rows), rows being lists of cell values, shared rather than copied
+		:param footer: list of the footer texts, None if the table has no footer passage
+		'''
+		self.file = file
+		self.id = id
+		self.cell_id = cell_id
+		self.title = title
+		self.caption = caption
+		self.columns = columns
+		self.sections = sections
+		self.footer = footer
+
+
+class collection:
+	'''
+	a BioC collection of documents with an as_dict method, converted to a BioC dict only when written
+	'''
+	__slots__ = ('source', 'key', 'date', 'documents')
+
+	def as_dict(self):
+		return {
+			"source": self.source,
+			"date": self.date,
+			"key": self.key,
+			"infons": {},
+			"documents": [document.as_dict() for document in self.documents]
+		}
+
+	def __init__(self, source, key, documents=None):
+		'''
+		:param source: source of the collection
+		:param key: key file of the collection
+		:param documents: list of documents, such as table_document
+		'''
+		self.source = source
+		self.key = key
+		self.date = datetime.today().strftime("%Y%m%d")
+		self.documents = documents if documents is not None else []
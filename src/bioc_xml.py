@@ -0,0 +1,164 @@
+import io
+import json
+import re
+
+# characters escaped in text, and characters not allowed in XML 1.0 which are dropped
+TEXT_REGEX = re.compile('[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+TEXT_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'}
+ATTR_REGEX = re.compile('[&<>"\n\r\t\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+ATTR_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'}
+
+# keys of BioC JSON objects which have a place in BioC XML, other keys are written as infons
+DOCUMENT_KEYS = {'id', 'infons', 'passages', 'annotations', 'relations'}
+# the columns and cells of table passages are written as annotations
+PASSAGE_KEYS = {'offset', 'infons', 'text', 'sentences', 'annotations', 'relations', 'columns', 'results_section'}
+
+
+def escape_text(text):
+	return TEXT_REGEX.sub(lambda m: TEXT_ESCAPES.get(m.group(), ''), text)
+
+
+def escape_attr(text):
+	return ATTR_REGEX.sub(lambda m: ATTR_ESCAPES.get(m.group(), ''), text)
+
+
+class BiocXMLWriter:
+	'''
+	writes BioC collections, as built for BioC JSON output, straight to BioC XML. Apart from tables, output matches
+	converting the JSON with the bioc package (bioc.loads then bioc.dumps) without building the JSON string or any
+	element tree: infon values are written as str() of the value, as bioc does.
+
+	The column headers and cells of table passages become annotations of the passage, with a type infon of
+	table_column or table_cell. Columns have a column infon and the header as text. Cells keep their id and have
+	section_title_1, row and column infons and the value as text. Other keys BioC XML has no element for, such as the
+	file of table and abbreviation documents, are written as extra infons, JSON encoded unless they are strings.
+	'''
+
+	def __element(self, depth, name, text):
+		if text is None:
+			self.fp.write('{}<{}/>\n'.format('  ' * depth, name))
+		else:
+			self.fp.write('{}<{}>{}</{}>\n'.format('  ' * depth, name, escape_text(str(text)), name))
+
+	def __infons(self, depth, infons, extra=None):
+		indent = '  ' * depth
+		for key, value in infons.items():
+			self.fp.write('{}<infon key="{}">{}</infon>\n'.format(indent, escape_attr(str(key)), escape_text(str(value))))
+		for key, value in (extra or {}).items():
+			if not isinstance(value, str):
+				value = json.dumps(value, ensure_ascii=False)
+			self.fp.write('{}<infon key="{}">{}</infon>\n'.format(indent, escape_attr(str(key)), escape_text(value)))
+
+	def __annotation(self, depth, annotation):
+		indent = '  ' * depth
+		self.fp.write('{}<annotation id="{}">\n'.format(indent, escape_attr(str(annotation.get('id')))))
+		self.__infons(depth + 1, annotation.get('infons', {}))
+		for location in annotation.get('locations', []):
+			self.fp.write('{}  <location offset="{}" length="{}"/>\n'.format(
+				indent, escape_attr(str(location['offset'])), escape_attr(str(location['length']))))
+		self.__element(depth + 1, 'text', annotation.get('text'))
+		self.fp.write('{}</annotation>\n'.format(indent))
+
+	def __relation(self, depth, relation):
+		indent = '  ' * depth
+		self.fp.write('{}<relation id="{}">\n'.format(indent, escape_attr(str(relation.get('id')))))
+		self.__infons(depth + 1, relation.get('infons', {}))
+		for node in relation.get('nodes', []):
+			self.fp.write('{}  <node refid="{}" role="{}"/>\n'.format(
+				indent, escape_attr(str(node['refid'])), escape_attr(str(node.get('role', '')))))
+		self.fp.write('{}</relation>\n'.format(indent))
+
+	def __table_annotations(self, depth, passage):
+		indent = '  ' * depth
+		for column, header in enumerate(passage.get('columns', [])):
+			self.fp.write('{}<annotation id="column.{}">\n'.format(indent, column))
+			self.__infons(depth + 1, {'type': 'table_column', 'column': column})
+			self.__element(depth + 1, 'text', header)
+			self.fp.write('{}</annotation>\n'.format(indent))
+		row = 0
+		for section in passage.get('results_section', []):
+			for results_row in section.get('results_rows', []):
+				for column, cell in enumerate(results_row):
+					self.fp.write('{}<annotation id="{}">\n'.format(indent, escape_attr(str(cell.get('id')))))
+					self.__infons(depth + 1, {'type': 'table_cell', 'section_title_1': section.get('section_title_1', ''),
+					                          'row': row, 'column': column})
+					self.__element(depth + 1, 'text', cell.get('text'))
+					self.fp.write('{}</annotation>\n'.format(indent))
+				row += 1
+
+	def __annotations_relations(self, depth, obj):
+		for annotation in obj.get('annotations', []):
+			self.__annotation(depth, annotation)
+		for relation in obj.get('relations', []):
+			self.__relation(depth, relation)
+
+	def __sentence(self, depth, sentence):
+		self.fp.write('{}<sentence>\n'.format('  ' * depth))
+		self.__infons(depth + 1, sentence.get('infons', {}))
+		self.__element(depth + 1, 'offset', sentence['offset'])
+		if sentence.get('text'):
+			self.__element(depth + 1, 'text', sentence['text'])
+		self.__annotations_relations(depth + 1, sentence)
+		self.fp.write('{}</sentence>\n'.format('  ' * depth))
+
+	def write_passage(self, passage, depth=2):
+		"""
+		write a BioC JSON passage dict as a passage element
+		"""
+		self.fp.write('{}<passage>\n'.format('  ' * depth))
+		self.__infons(depth + 1, passage.get('infons', {}),
+		              {key: value for key, value in passage.items() if key not in PASSAGE_KEYS})
+		self.__element(depth + 1, 'offset', passage['offset'])
+		if passage.get('text'):
+			self.__element(depth + 1, 'text', passage['text'])
+		for sentence in passage.get('sentences', []):
+			self.__sentence(depth + 1, sentence)
+		self.__table_annotations(depth + 1, passage)
+		self.__annotations_relations(depth + 1, passage)
+		self.fp.write('{}</passage>\n'.format('  ' * depth))
+
+	def write_document(self, document):
+		"""
+		write a BioC JSON document dict as a document element, one passage at a time
+		"""
+		self.fp.write('  <document>\n')
+		self.__element(2, 'id', document.get('id'))
+		self.__infons(2, document.get('infons', {}),
+		              {key: value for key, value in document.items() if key not in DOCUMENT_KEYS})
+		for passage in document.get('passages', []):
+			self.write_passage(passage)
+		self.__annotations_relations(2, document)
+		self.fp.write('  </document>\n')
+
+	def write_collection(self, collection):
+		"""
+		write a whole BioC JSON collection dict
+
+		Args:
+			collection: dict with source, date, key, infons and documents
+
+		"""
+		self.fp.write("<?xml version='1.0' encoding='utf-8' standalone='yes'?>\n<collection>\n")
+		for name in ['source', 'date', 'key']:
+			self.__element(1, name, collection.get(name))
+		self.__infons(1, collection.get('infons', {}))
+		for document in collection.get('documents', []):
+			self.write_document(document)
+		self.fp.write('</collection>\n')
+
+	def __init__(self, fp):
+		'''
+		:param fp: text file object written to
+		'''
+		self.fp = fp
+
+
+def dumps(collection):
+	"""
+	Returns:
+		the BioC JSON collection dict as a BioC XML string
+
+	"""
+	fp = io.StringIO()
+	BiocXMLWriter(fp).write_collection(collection)
+	return fp.getvalue()
@@ -0,0 +1,75 @@
+import re
+from bs4 import Tag
+
+
+# markup left over from serialising a cell which carries no meaning in the output
+STRIP_TAGS_REGEX = re.compile(r"<\/?span[^>\n]*>?|<hr\/>?")
+# p-values written as 1.2 x 10-5, 1.2×10−5 etc.
+PVAL_REGEX = re.compile(r'((\d+\.\d+)|(\d+))(\s?)[*××xX](\s{0,1})10[_]{0,1}([–−-])(\d+)')
+PVAL_MULTIPLIER_REGEX = re.compile(r'(\s{0,1})[*××xX](\s{0,1})10(_{0,1})')
+# p-values written as 1.2e-5, 1.2 E − 5 etc.
+PVAL_SCIENTIFIC_REGEX = re.compile(r'((\d+.\d+)|(\d+))(\s{0,1})[eE](\s{0,1})([–−-])(\s{0,1})(\d+)')
+PVAL_SCIENTIFIC_MINUS_REGEX = re.compile(r'(\s{0,1})[–−-](\s{0,1})')
+PVAL_SCIENTIFIC_EXPONENT_REGEX = re.compile(r'(\s{0,1})[eE]')
+
+
+class cell_normaliser:
+	'''
+	cleans the contents of table cells, all patterns are compiled once at import time
+	'''
+
+	def __cell_markup(self, cell):
+		"""
+		serialise the contents of a cell
+
+		Args:
+			cell: td/th element, beautiful soup object
+
+		Returns:
+			value: the inner html of the cell
+
+		"""
+		contents = cell.contents
+		# the common case is a cell holding a single string, which needs no serialisation
+		if len(contents) == 1 and not isinstance(contents[0], Tag):
+			return str(contents[0])
+		return ''.join(str(x) for x in contents)
+
+	def normalise_text(self, value):
+		"""
+		clean a serialised cell value and rewrite p-values into a float-parsable form
+
+		Args:
+			value: inner html of a cell
+
+		Returns:
+			value: cleaned cell value
+
+		"""
+		value = value.strip().replace('\u2009', ' ')
+		if '<' in value:
+			value = STRIP_TAGS_REGEX.sub('', value)
+		if value.startswith('(') and value.endswith(')'):
+			value = value[1:-1]
+		# both p-value patterns are anchored on a leading digit, so anything else can skip them
+		if not value[:1].isdecimal():
+			return value
+		if PVAL_REGEX.match(value):
+			value = PVAL_MULTIPLIER_REGEX.sub('e', value).replace('−', '-')
+		if PVAL_SCIENTIFIC_REGEX.match(value):
+			value = PVAL_SCIENTIFIC_MINUS_REGEX.sub('-', value)
+			value = PVAL_SCIENTIFIC_EXPONENT_REGEX.sub('e', value)
+		return value
+
+	def normalise(self, cell):
+		"""
+		clean a table cell
+
+		Args:
+			cell: td/th element, beautiful soup object
+
+		Returns:
+			value: cleaned cell value
+
+		"""
+		return self.normalise_text(self.__cell_markup(cell))
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+# cell values ignored when typing columns and rows
+EMPTY_VALUES = {'none', '', '-'}
+
+# cell type codes
+SKIP = 0
+NUM = 1
+TXT = 2
+MIX = 3
+# all digits but not parsable as a float (e.g. superscripts), counted as nothing
+OTHER = 4
+
+# order matters: ties between the counts are resolved in this order
+COLUMN_TYPES = [(NUM, 'num'), (TXT, 'txt'), (MIX, 'mix')]
+
+
+class column_typer:
+	'''
+	types the cells of a 2d table once and answers column type, subheader and numeric conversion queries from that pass
+	'''
+
+	def __classify(self, value):
+		"""
+		determine the type of a single cell value and parse it
+
+		Args:
+			value: cell value as str
+
+		Returns:
+			(type code, True if the value holds no digits, value converted to float where possible)
+
+		"""
+		if value.lower() in EMPTY_VALUES:
+			return SKIP, False, value
+		has_digit = any(char.isdigit() for char in value)
+		try:
+			number = float(value.replace(',', ''))
+			code = NUM
+		except ValueError:
+			number = None
+			if not has_digit:
+				code = TXT
+			elif not value.isdigit():
+				code = MIX
+			else:
+				code = OTHER
+		# the final conversion also accepts unicode minus signs and dashes
+		if '−' in value or '–' in value:
+			try:
+				number = float(value.replace('−', '-').replace('–', '-').replace(',', ''))
+			except ValueError:
+				number = None
+		return code, not has_digit, value if number is None else number
+
+	def __type_cells(self, table_2d):
+		"""
+		classify every distinct value in the table and build the type matrices
+
+		Args:
+			table_2d: nested list table
+
+		"""
+		codes = []
+		texts = []
+		for row in table_2d:
+			row_codes = []
+			row_texts = []
+			for cell in row:
+				cell_type = self.cache.get(cell)
+				if cell_type is None:
+					cell_type = self.cache[cell] = self.__classify(str(cell))
+				row_codes.append(cell_type[0])
+				row_texts.append(cell_type[1])
+			codes.append(row_codes)
+			texts.append(row_texts)
+		n_cols = len(table_2d[0])
+		self.codes = np.array(codes, dtype=np.int8).reshape(len(table_2d), n_cols)
+		self.texts = np.array(texts, dtype=bool).reshape(len(table_2d), n_cols)
+
+	def __column_types(self):
+		"""
+		determine the majority type of each column
+
+		Returns:
+			col_type: list of 'num', 'txt' or 'mix', one per column
+
+		"""
+		counts = np.stack([(self.codes == code).sum(axis=0) for code, _ in COLUMN_TYPES])
+		# argmax returns the first maximum, matching the tie order of COLUMN_TYPES
+		return [COLUMN_TYPES[i][1] for i in counts.argmax(axis=0)]
+
+	def subheader_rows(self, value_idx):
+		"""
+		find value rows where at least half the cells are text in non-text columns
+
+		Args:
+			value_idx: list of row indices to check
+
+		Returns:
+			subheader_idx: list of subheader row indices
+
+		"""
+		if not value_idx:
+			return []
+		non_text_cols = np.array([i != 'txt' for i in self.col_type], dtype=bool)
+		unmatched = (self.texts[value_idx] & non_text_cols).sum(axis=1)
+		n_cols = self.codes.shape[1]
+		return [row_idx for row_idx, cnt in zip(value_idx, unmatched) if cnt >= n_cols / 2]
+
+	def convert(self, table_2d):
+		"""
+		convert numeric cells to floats in place, reusing the parses from typing
+
+		Args:
+			table_2d: the nested list table this typer was built from
+
+		"""
+		cache = self.cache
+		for row in table_2d:
+			row[:] = [cache[cell][2] for cell in row]
+
+	def __init__(self, table_2d):
+		self.cache = {}
+		self.__type_cells(table_2d)
+		self.col_type = self.__column_types()
@@ -0,0 +1,125 @@
+import gzip
+import io
+import json
+
+COMPRESSIONS = ['gzip', 'zstd']
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+MAGIC = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def zstandard():
+	try:
+		import zstandard
+	except ImportError:
+		raise ImportError("zstd compression needs the zstandard package: pip install zstandard")
+	return zstandard
+
+
+def check(compress):
+	if compress is not None and compress not in COMPRESSIONS:
+		raise ValueError("unknown compression: {}".format(compress))
+
+
+def output_path(path, compress=None):
+	"""
+	Returns:
+		path with the suffix of the compression added
+	"""
+	check(compress)
+	return path + SUFFIXES[compress] if compress else path
+
+
+def open_output(path, compress=None, text=False, buffering=-1):
+	"""
+	open a file for writing, compressing what is written as it is written
+
+	Args:
+		path: file path, without the compression suffix
+		compress: None, 'gzip' or 'zstd'
+		text: text file object writing UTF-8 rather than binary
+		buffering: buffer size of the file written, as for open. Not used with gzip
+
+	Returns:
+		file object, closing it finishes the compressed stream
+
+	"""
+	path = output_path(path, compress)
+	if compress == 'gzip':
+		fp = gzip.open(path, 'wb', compresslevel=GZIP_LEVEL)
+	elif compress == 'zstd':
+		fp = zstandard().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb', buffering), closefd=True)
+	else:
+		fp = open(path, 'wb', buffering)
+	return io.TextIOWrapper(fp, encoding='utf-8') if text else fp
+
+
+def compress_bytes(data, compress=None):
+	"""
+	compress data as one complete gzip member or zstd frame. Members and frames can be concatenated, a file of them
+	reads as one stream through open_input.
+	"""
+	check(compress)
+	if compress == 'gzip':
+		return gzip.compress(data, compresslevel=GZIP_LEVEL)
+	if compress == 'zstd':
+		return zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+	return data
+
+
+def detect(header):
+	"""
+	Returns:
+		compression of data starting with header, None if not compressed
+	"""
+	for magic, compress in MAGIC.items():
+		if header.startswith(magic):
+			return compress
+	return None
+
+
+def decompress_bytes(data):
+	"""
+	decompress data from compress_bytes, plain data is returned as is
+	"""
+	compress = detect(data[:4])
+	if compress == 'gzip':
+		return gzip.decompress(data)
+	if compress == 'zstd':
+		return zstandard().ZstdDecompressor().decompress(data)
+	return data
+
+
+def open_input(path, text=False):
+	"""
+	open an output file for reading, whether it is plain, gzip or zstd compressed. The compression is recognised from
+	the start of the file, not its name.
+
+	Args:
+		path: file path
+		text: text file object reading UTF-8 rather than binary
+
+	Returns:
+		file object of the decompressed data
+
+	"""
+	with open(path, 'rb') as f:
+		compress = detect(f.read(4))
+	if compress == 'gzip':
+		fp = gzip.open(path, 'rb')
+	elif compress == 'zstd':
+		fp = zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+		fp = io.BufferedReader(fp)
+	else:
+		fp = open(path, 'rb')
+	return io.TextIOWrapper(fp, encoding='utf-8') if text else fp
+
+
+def load_json(path):
+	"""
+	Returns:
+		the content of a plain or compressed JSON output file
+	"""
+	with open_input(path) as f:
+		return json.load(f)
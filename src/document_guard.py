@@ -0,0 +1,365 @@
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+
+from src.memory_monitor import read_status
+
+try:
+	import resource
+except ImportError:
+	# not on Windows
+	resource = None
+
+# seconds between checks of the time, memory and liveness of a worker process
+POLL_INTERVAL = 0.05
+# longest stage name passed back from a worker process
+STAGE_BYTES = 64
+
+
+def error_text(e):
+	"""
+	Returns:
+		one line description of an exception
+	"""
+	return "{}: {}".format(type(e).__name__, e)
+
+
+class zygote:
+	'''
+	a process forked by document_guard.start before the parent runs any other threads, which forks the worker
+	processes in turn and waits for them when asked. Forked from the parent later, a worker would inherit the locks
+	held by its other threads, never to be released, and the memory of everything it has loaded since.
+	'''
+
+	def __serve(self, conn, serve):
+		# Ctrl+C is for the parent, which stops the zygote by closing the connection
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		while True:
+			try:
+				request, pid = conn.recv()
+			except EOFError:
+				break
+			if request == "fork":
+				parent_conn, child_conn = multiprocessing.Pipe()
+				pid = os.fork()
+				if pid == 0:
+					conn.close()
+					parent_conn.close()
+					os.setpgid(0, 0)
+					code = 0
+					try:
+						serve(child_conn)
+					except BaseException:
+						code = 1
+					finally:
+						sys.stdout.flush()
+						sys.stderr.flush()
+						os._exit(code)
+				# also set here, so the group exists before the parent can signal it
+				os.setpgid(pid, pid)
+				child_conn.close()
+				conn.send(pid)
+				reduction.send_handle(conn, parent_conn.fileno(), None)
+				parent_conn.close()
+			else:
+				try:
+					waited, status = os.waitpid(pid, 0 if request == "wait" else os.WNOHANG)
+				except ChildProcessError:
+					# already waited for
+					conn.send(None)
+					continue
+				conn.send(os.waitstatus_to_exitcode(status) if waited else None)
+
+	def fork(self):
+		"""
+		Returns:
+			(process id, connection) of a new worker process
+		"""
+		self.conn.send(("fork", None))
+		pid = self.conn.recv()
+		return pid, Connection(reduction.recv_handle(self.conn))
+
+	def exitcode(self, pid, wait=False):
+		"""
+		Args:
+			pid: process id of a worker
+			wait: wait for the worker to exit
+
+		Returns:
+			exit code of the worker, negative for the signal that ended it, None if it is running
+		"""
+		self.conn.send(("wait" if wait else "poll", pid))
+		return self.conn.recv()
+
+	def close(self):
+		self.conn.close()
+		os.waitpid(self.pid, 0)
+
+	def __init__(self, serve):
+		'''
+		:param serve: function run by the worker processes with their end of a connection to the parent
+		'''
+		# output still buffered would otherwise be written again by each process
+		sys.stdout.flush()
+		sys.stderr.flush()
+		self.conn, child_conn = multiprocessing.Pipe()
+		self.pid = os.fork()
+		if self.pid == 0:
+			self.conn.close()
+			try:
+				self.__serve(child_conn, serve)
+			finally:
+				os._exit(0)
+		child_conn.close()
+
+
+class worker:
+	'''
+	a worker process of a document_guard, forked by its zygote, running the handler on one document at a time sent
+	to it over a pipe. It leads its own process group, so the processes it starts are stopped with it.
+	'''
+
+	def stop(self, zygote):
+		"""
+		Returns:
+			exit code of the process
+		"""
+		try:
+			os.killpg(self.pid, signal.SIGKILL)
+		except OSError:
+			# the group has no processes left
+			pass
+		self.conn.close()
+		return zygote.exitcode(self.pid, wait=True)
+
+	def __init__(self, zygote):
+		'''
+		:param zygote: zygote forking the process
+		'''
+		self.pid, self.conn = zygote.fork()
+
+
+class document_guard:
+	'''
+	processes documents under an isolation boundary, so a document that fails does not stop the batch. A document
+	whose handler raises an error, takes longer than timeout seconds or makes its process grow by more than
+	memory_cap bytes is retried up to retries times and then quarantined: a line with its key, the stage it failed
+	in, the error, the seconds spent on it and the attempts made is appended to the JSON Lines report, and process
+	returns None.
+
+	Without a timeout or memory cap handlers run in this process, unless processes is set. Otherwise they run in a
+	worker process, which is killed when the document runs out of time or memory (the growth of the resident set size
+	over its size when the document was sent is checked every POLL_INTERVAL seconds, on Linux) or when the process
+	has exited without answering, and is replaced by a fresh one for the next document. Retries always run in a fresh
+	worker. Workers are forked by a zygote process, which start forks, and should be called before this process
+	starts any threads. The stage comes from the on_stage callback of a stage_timer, set to the guard's on_stage.
+	'''
+
+	def __serve(self, conn):
+		"""
+		the loop of a worker process
+		"""
+		self.in_worker = True
+		if self.memory_cap and resource is not None and not read_status():
+			# the resident set size cannot be watched, limit the address space instead
+			resource.setrlimit(resource.RLIMIT_AS, (self.memory_cap, self.memory_cap))
+		while True:
+			try:
+				key, args = conn.recv()
+			except EOFError:
+				break
+			try:
+				message = ("ok", self.handler(key, *args))
+			except Exception as e:
+				message = ("error", error_text(e))
+			sys.stdout.flush()
+			sys.stderr.flush()
+			try:
+				conn.send(message)
+			except Exception as e:
+				# the result could not be pickled
+				conn.send(("error", "result could not be returned: " + error_text(e)))
+
+	def on_stage(self, name):
+		"""
+		stage_timer callback, following the stage of the document in each thread
+		"""
+		if self.in_worker:
+			self.stage.value = (name or "").encode("utf-8")[:STAGE_BYTES - 1]
+		else:
+			self.local.stage = name
+
+	def __worker_stage(self):
+		return self.stage.value.decode("utf-8", "replace") or None
+
+	def __run_here(self, func, args):
+		"""
+		Returns:
+			(result, None) on success, (None, (stage, error)) on failure
+		"""
+		self.local.stage = None
+		try:
+			return func(*args), None
+		except Exception as e:
+			if self.fail_fast:
+				raise
+			return None, (getattr(self.local, "stage", None), error_text(e))
+
+	def __stop_worker(self):
+		"""
+		Returns:
+			exit code of the worker, None if there was none
+		"""
+		if self.worker is None:
+			return None
+		current = self.worker
+		self.worker = None
+		return current.stop(self.zygote)
+
+	def __run_in_worker(self, key, args):
+		"""
+		Returns:
+			(result, None) on success, (None, (stage, error)) on failure
+		"""
+		self.start()
+		if self.worker is None:
+			self.worker = worker(self.zygote)
+		current = self.worker
+		self.stage.value = b""
+		baseline = read_status(current.pid).get("VmRSS", 0)
+		start = time.perf_counter()
+		current.conn.send((key, args))
+		error = None
+		while not current.conn.poll(POLL_INTERVAL):
+			elapsed = time.perf_counter() - start
+			if self.timeout and elapsed > self.timeout:
+				error = "timed out after {:.1f} s".format(elapsed)
+			elif self.memory_cap:
+				growth = read_status(current.pid).get("VmRSS", baseline) - baseline
+				if growth > self.memory_cap:
+					error = "memory cap of {:.0f} MB exceeded, resident set size grew by {:.0f} MB".format(
+						self.memory_cap / 1024 ** 2, growth / 1024 ** 2)
+			if error is None:
+				code = self.zygote.exitcode(current.pid)
+				if code is not None:
+					# exited, while processes it started keep the pipe open
+					error = "worker process exited with code {}".format(code)
+			if error is not None:
+				stage = self.__worker_stage()
+				self.__stop_worker()
+				return None, (stage, error)
+		try:
+			message = current.conn.recv()
+		except EOFError:
+			# killed or crashed, for instance by the out of memory killer
+			stage = self.__worker_stage()
+			return None, (stage, "worker process exited with code {}".format(self.__stop_worker()))
+		if message[0] == "error":
+			return None, (self.__worker_stage(), message[1])
+		return message[1], None
+
+	def __quarantine(self, key, stage, error, elapsed, attempts):
+		record = {"key": key, "stage": stage, "error": error, "elapsed": round(elapsed, 3), "attempts": attempts}
+		with self.lock:
+			self.quarantined += 1
+			if self.report is not None:
+				self.report.write(json.dumps(record, ensure_ascii=False) + "\n")
+				self.report.flush()
+		print("{} quarantined, failed in stage {}: {}".format(key, stage, error))
+		if self.fail_fast:
+			raise RuntimeError("{} failed in stage {}: {}".format(key, stage, error))
+
+	def process(self, key, *args):
+		"""
+		run the handler on a document, retrying and quarantining it if it fails
+
+		Args:
+			key: document name
+			args: further arguments of the handler, pickled to worker processes
+
+		Returns:
+			result of the handler, None if the document was quarantined
+		"""
+		start = time.perf_counter()
+		for attempt in range(1, self.retries + 2):
+			if self.processes:
+				result, failure = self.__run_in_worker(key, args)
+			else:
+				result, failure = self.__run_here(self.handler, (key,) + args)
+			if failure is None:
+				if attempt > 1:
+					self.recovered += 1
+				return result
+			if self.processes:
+				# retry in a fresh worker
+				self.__stop_worker()
+		self.__quarantine(key, *failure, time.perf_counter() - start, attempt)
+		return None
+
+	def protect(self, key, func, *args):
+		"""
+		run func(*args) in this process, without a timeout or retries, quarantining the document if it fails. For
+		steps that follow process, such as writing the outputs
+
+		Returns:
+			result of func, None if the document was quarantined
+		"""
+		start = time.perf_counter()
+		result, failure = self.__run_here(func, args)
+		if failure is not None:
+			self.__quarantine(key, *failure, time.perf_counter() - start, 1)
+		return result
+
+	def start(self):
+		"""
+		start the zygote the worker processes are forked from, if documents are processed in workers. Call it before
+		this process starts any threads, otherwise the first document starts it
+		"""
+		if self.processes and self.zygote is None:
+			self.zygote = zygote(self.__serve)
+
+	def close(self):
+		self.__stop_worker()
+		if self.zygote is not None:
+			self.zygote.close()
+			self.zygote = None
+		if self.report is not None:
+			self.report.close()
+			self.report = None
+
+	def __init__(self, handler, timeout=0, memory_cap=0, retries=0, processes=False, report=None, fail_fast=False):
+		'''
+		:param handler: function processing a document, called with its key and the further arguments of process
+		:param timeout: seconds a document may take, 0 for no limit
+		:param memory_cap: bytes the resident memory of a worker process may grow by on a document, 0 for no limit
+		:param retries: times a failed document is tried again
+		:param processes: run handlers in worker processes even without a timeout or memory cap
+		:param report: JSON Lines file the quarantined documents are written to, none if not given
+		:param fail_fast: raise the error of the first failed document instead of quarantining it, as before
+		'''
+		self.handler = handler
+		self.timeout = timeout
+		self.memory_cap = memory_cap
+		self.retries = max(0, retries)
+		self.processes = processes or bool(timeout) or bool(memory_cap)
+		self.fail_fast = fail_fast
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.in_worker = False
+		self.worker = None
+		self.quarantined = 0
+		self.recovered = 0
+		self.zygote = None
+		self.stage = None
+		if self.processes:
+			if not hasattr(os, "fork"):
+				raise ValueError("worker processes, needed for document timeouts and memory caps, need os.fork")
+			# the stage of the document in the worker, shared with the zygote and so with the workers it forks
+			self.stage = multiprocessing.RawArray("c", STAGE_BYTES)
+		self.report = open(report, "w", encoding="utf-8") if report else None
@@ -0,0 +1,180 @@
+import cProfile
+import os
+import pstats
+import re
+import time
+
+# deepest stack written to collapsed stack files, deeper calls are cut off
+MAX_DEPTH = 200
+# stacks with less than this share of the profiled time are left out of collapsed stack files
+MIN_SHARE = 0.001
+# most stacks written to a collapsed stack file, the slowest are kept
+MAX_STACKS = 1000
+
+
+def function_name(func):
+	"""
+	Returns:
+		readable name of a pstats function key (file, line, name)
+	"""
+	file, line, name = func
+	if file == '~':
+		# built in functions
+		return name
+	return "{}:{}:{}".format(os.path.basename(file), line, name)
+
+
+def collapsed_stacks(stats, min_share=MIN_SHARE, max_stacks=MAX_STACKS):
+	"""
+	turn profile stats into collapsed stacks, one "outer;inner;innermost microseconds" line per stack, as read by flame
+	graph tools. cProfile only records caller and callee pairs, so the time of a function called from several places
+	is split between its callers by their share of its calls' cumulative time. Stacks under min_share of the total
+	time, and all but the max_stacks slowest, are left out, keeping the files small.
+
+	Args:
+		stats: pstats.Stats
+		min_share: share of the total time a stack must take to be written
+		max_stacks: most stacks written, 0 for no limit
+
+	Returns:
+		list of lines, slowest stack first
+
+	"""
+	entries = stats.stats
+	callees = {}
+	for func, (cc, nc, tt, ct, callers) in entries.items():
+		for caller, edge in callers.items():
+			callees.setdefault(caller, []).append((func, edge[3]))
+	roots = [func for func, entry in entries.items() if not entry[4]]
+	totals = {}
+	# seconds, at least a microsecond
+	cutoff = max(1e-6, stats.total_tt * min_share)
+
+	def walk(func, stack, share, depth):
+		cc, nc, tt, ct, callers = entries[func]
+		stack = stack + [function_name(func)]
+		key = ";".join(stack)
+		totals[key] = totals.get(key, 0.0) + tt * share
+		if depth >= MAX_DEPTH:
+			return
+		for callee, edge_ct in callees.get(func, []):
+			if function_name(callee) in stack:
+				# recursion, already counted in the callee's own totals
+				continue
+			callee_ct = entries[callee][3]
+			callee_share = share * min(1.0, edge_ct / callee_ct) if callee_ct > 0 else 0.0
+			# paths below the cutoff in all hold less than it, leaving them out keeps the walk of large call graphs short
+			if callee_share * callee_ct >= cutoff:
+				walk(callee, stack, callee_share, depth + 1)
+
+	for root in roots:
+		walk(root, [], 1.0, 0)
+	stacks = sorted(((value, key) for key, value in totals.items() if value >= cutoff), reverse=True)
+	if max_stacks:
+		stacks = stacks[:max_stacks]
+	return ["{} {}".format(key, int(round(value * 1e6))) for value, key in stacks]
+
+
+def write_profile(stats, path):
+	"""
+	write stats as path.pstats and path.collapsed
+	"""
+	stats.dump_stats(path + ".pstats")
+	with open(path + ".collapsed", "w") as f:
+		for line in collapsed_stacks(stats):
+			f.write(line + "\n")
+
+
+class profile:
+	'''
+	cProfile of one document, written if it took at least the threshold
+	'''
+
+	def __enter__(self):
+		self.profiler = cProfile.Profile()
+		self.start = time.perf_counter()
+		self.profiler.enable()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.profiler.disable()
+		elapsed = time.perf_counter() - self.start
+		self.parent.add(self.key, self.profiler, elapsed)
+		return False
+
+	def __init__(self, parent, key):
+		self.parent = parent
+		self.key = key
+
+
+class no_profile:
+	'''
+	profile of a disabled profiler, does nothing
+	'''
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+
+NO_PROFILE = no_profile()
+
+
+class document_profiler:
+	'''
+	cProfile per document, for finding out why some documents are slow. Each document profiled for at least
+	threshold seconds is written to out_dir as {key}.pstats (for pstats or snakeviz) and {key}.collapsed (collapsed
+	stacks for flame graphs, the slowest only, see collapsed_stacks), named after the document key with path
+	separators replaced. Every document is added to an aggregate profile of the run, written by close as
+	aggregate.pstats and aggregate.collapsed. Profiles only the thread running the document.
+	'''
+
+	def file_name(self, key):
+		name = re.sub(r'[^\w.-]+', '_', key.strip('/')) or 'document'
+		path = os.path.join(self.out_dir, name)
+		# keys can map to the same name, keep every profile
+		number = 1
+		while path in self.written:
+			number += 1
+			path = os.path.join(self.out_dir, "{}_{}".format(name, number))
+		self.written.add(path)
+		return path
+
+	def add(self, key, profiler, elapsed):
+		stats = pstats.Stats(profiler)
+		if self.aggregate is None:
+			self.aggregate = pstats.Stats(profiler)
+		else:
+			self.aggregate.add(stats)
+		self.documents += 1
+		if elapsed >= self.threshold:
+			write_profile(stats, self.file_name(key))
+			self.profiles_written += 1
+
+	def profile(self, key):
+		return profile(self, key) if self.enabled else NO_PROFILE
+
+	def close(self):
+		"""
+		write the aggregate profile
+		"""
+		if self.aggregate is not None:
+			write_profile(self.aggregate, os.path.join(self.out_dir, "aggregate"))
+
+	def __init__(self, out_dir, threshold=0.0, enabled=True):
+		'''
+		:param out_dir: directory the profiles are written to, created if missing
+		:param threshold: seconds a document must take for its own profile to be written
+		:param enabled: profile, otherwise profile does nothing
+		'''
+		self.out_dir = out_dir
+		self.threshold = threshold
+		self.enabled = enabled
+		self.aggregate = None
+		self.documents = 0
+		self.profiles_written = 0
+		self.written = set()
+		if enabled:
+			os.makedirs(out_dir, exist_ok=True)
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class input_prefetcher:
+	'''
+	reads the input files of upcoming articles on a thread pool while the current article is processed. Iterating
+	gives (key, {file path: bytes}) in the order of the groups. Up to workers groups are read at once, and no more
+	groups are started while max_bytes or more of read groups are waiting to be processed, so the read ahead is
+	bounded by max_bytes plus the groups being read. Files that cannot be read are left out of the dict, to be read
+	(and fail) as usual. Records the time spent reading, the time the consumer waited for reads (I/O wait) and the time
+	it spent on each article between reads (CPU).
+	'''
+
+	def __read(self, paths):
+		start = time.perf_counter()
+		data = {}
+		for path in paths:
+			try:
+				with open(path, "rb") as f:
+					data[path] = f.read()
+			except OSError:
+				continue
+		size = sum(len(value) for value in data.values())
+		with self.lock:
+			self.read_seconds += time.perf_counter() - start
+			self.files += len(data)
+			self.bytes += size
+			self.window += size
+		return data, size
+
+	def __iter__(self):
+		groups = iter(self.groups)
+		pending = deque()
+		done = False
+		with ThreadPoolExecutor(self.workers) as executor:
+			while True:
+				while not done and len(pending) < self.workers and self.window < self.max_bytes:
+					try:
+						key, paths = next(groups)
+					except StopIteration:
+						done = True
+						break
+					pending.append((key, executor.submit(self.__read, paths)))
+				if not pending:
+					break
+				key, future = pending.popleft()
+				start = time.perf_counter()
+				data, size = future.result()
+				handed = time.perf_counter()
+				self.wait_seconds += handed - start
+				with self.lock:
+					self.window -= size
+				yield key, data
+				self.cpu_seconds += time.perf_counter() - handed
+
+	def stats(self):
+		"""
+		Returns:
+			dict of files and bytes read, seconds spent reading, seconds waited for reads and seconds processing
+		"""
+		return {
+			"files": self.files,
+			"bytes": self.bytes,
+			"read_seconds": self.read_seconds,
+			"io_wait_seconds": self.wait_seconds,
+			"cpu_seconds": self.cpu_seconds
+		}
+
+	def __init__(self, groups, max_bytes=64 * 1024 ** 2, workers=4):
+		'''
+		:param groups: iterable of (key, list of file paths), the files of one article
+		:param max_bytes: bytes read ahead and waiting to be processed before reading stops
+		:param workers: groups read at once
+		'''
+		self.groups = groups
+		self.max_bytes = max_bytes
+		self.workers = max(1, workers)
+		self.lock = threading.Lock()
+		self.window = 0
+		self.files = 0
+		self.bytes = 0
+		self.read_seconds = 0.0
+		self.wait_seconds = 0.0
+		self.cpu_seconds = 0.0
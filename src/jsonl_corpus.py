@@ -0,0 +1,154 @@
+import glob
+import json
+import os
+import threading
+
+from src import bioc_json, compressed_io
+
+STREAMS = ['maintext', 'tables', 'abbreviations']
+
+
+class jsonl_corpus:
+	'''
+	corpus output as sharded JSON Lines files, one record per article and stream instead of one file per article.
+	Each record is a compact JSON line {"id": ..., "bioc": BioC collection}. Shards are named
+	{stream}-{number}.jsonl, with .gz or .zst added when compressed, each record then being a separate gzip member or
+	zstd frame. Shards are claimed with an exclusive create, so processes writing to the same directory never share a
+	shard; a shard is closed and the next one claimed once it would grow past shard_size. With index, each shard has
+	a {stream}-{number}.idx of [id, offset, length] JSON lines so single records can be read at random.
+	Safe to share between threads.
+	'''
+
+	def __claim(self, stream):
+		"""
+		Returns:
+			(shard path, file object) of a new shard no other writer has
+		"""
+		while True:
+			self.numbers[stream] += 1
+			path = os.path.join(self.out_dir, "{}-{:05d}.jsonl".format(stream, self.numbers[stream]))
+			path = compressed_io.output_path(path, self.compress)
+			try:
+				fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+			except FileExistsError:
+				continue
+			return path, os.fdopen(fd, "wb")
+
+	def __close_shard(self, stream):
+		shard = self.shards.pop(stream, None)
+		if shard:
+			for fp in shard[1:]:
+				if fp:
+					fp.close()
+
+	def write(self, stream, doc_id, collection):
+		"""
+		append a record to a stream
+
+		Args:
+			stream: 'maintext', 'tables' or 'abbreviations'
+			doc_id: article id, the key of the index
+			collection: BioC dict
+
+		"""
+		if stream not in STREAMS:
+			raise ValueError("unknown stream: {}".format(stream))
+		# encoded outside the lock, compact JSON has no line breaks
+		data = (bioc_json.dumps({"id": doc_id, "bioc": collection}, None, self.encoder) + "\n").encode("utf-8")
+		data = compressed_io.compress_bytes(data, self.compress)
+		with self.lock:
+			shard = self.shards.get(stream)
+			if shard and shard[1].tell() and shard[1].tell() + len(data) > self.shard_size:
+				self.__close_shard(stream)
+				shard = None
+			if not shard:
+				path, fp = self.__claim(stream)
+				index = open(path[:path.rindex(".jsonl")] + ".idx", "wb") if self.index else None
+				shard = self.shards[stream] = (path, fp, index)
+			path, fp, index = shard
+			offset = fp.tell()
+			fp.write(data)
+			# the record is on disk before the index points to it
+			fp.flush()
+			if index:
+				index.write((json.dumps([doc_id, offset, len(data)], ensure_ascii=False) + "\n").encode("utf-8"))
+				index.flush()
+			self.records += 1
+
+	def close(self):
+		with self.lock:
+			for stream in list(self.shards):
+				self.__close_shard(stream)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __init__(self, out_dir, shard_size=1024 ** 3, index=False, encoder='json', compress=None):
+		'''
+		:param out_dir: directory of the shards, created if missing
+		:param shard_size: bytes a shard is kept under, unless a single record is larger
+		:param index: write an offset index next to each shard
+		:param encoder: JSON encoder, see bioc_json
+		:param compress: None, 'gzip' or 'zstd'
+		'''
+		compressed_io.check(compress)
+		self.out_dir = out_dir
+		self.shard_size = shard_size
+		self.index = index
+		self.encoder = encoder
+		self.compress = compress
+		self.lock = threading.Lock()
+		self.shards = {}
+		self.numbers = dict.fromkeys(STREAMS, 0)
+		self.records = 0
+		os.makedirs(out_dir, exist_ok=True)
+
+
+def iter_records(out_dir, stream):
+	"""
+	read every record of a stream, shard by shard
+
+	Returns:
+		iterator of (id, BioC dict)
+
+	"""
+	for path in sorted(glob.glob(os.path.join(out_dir, "{}-*.jsonl*".format(stream)))):
+		with compressed_io.open_input(path) as f:
+			for line in f:
+				record = json.loads(line)
+				yield record["id"], record["bioc"]
+
+
+def read_index(out_dir, stream):
+	"""
+	Returns:
+		dict of id to (shard path, offset, length) from the index files of a stream
+
+	"""
+	index = {}
+	for path in sorted(glob.glob(os.path.join(out_dir, "{}-*.idx".format(stream)))):
+		shard_path = glob.glob(glob.escape(path[:-len(".idx")]) + ".jsonl*")[0]
+		with open(path, "rb") as f:
+			for line in f:
+				doc_id, offset, length = json.loads(line)
+				index[doc_id] = (shard_path, offset, length)
+	return index
+
+
+def read_record(index, doc_id):
+	"""
+	read a single record through an index from read_index
+
+	Returns:
+		BioC dict, or None if the id is not in the index
+
+	"""
+	if doc_id not in index:
+		return None
+	path, offset, length = index[doc_id]
+	with open(path, "rb") as f:
+		f.seek(offset)
+		return json.loads(compressed_io.decompress_bytes(f.read(length)))["bioc"]
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import sys
+import threading
+import tracemalloc
+
+try:
+	import resource
+except ImportError:
+	# not on Windows
+	resource = None
+
+
+def read_status(pid="self"):
+	"""
+	Args:
+		pid: process id, this process by default
+
+	Returns:
+		dict of the current (VmRSS) and peak (VmHWM) resident set size in bytes from /proc, empty if not on Linux
+	"""
+	try:
+		with open("/proc/{}/status".format(pid)) as f:
+			status = f.read()
+	except OSError:
+		return {}
+	sizes = {}
+	for name in ["VmRSS", "VmHWM"]:
+		match = re.search(r"^{}:\s+(\d+) kB".format(name), status, re.MULTILINE)
+		if match:
+			sizes[name] = int(match.group(1)) * 1024
+	return sizes
+
+
+def reset_peak_rss():
+	"""
+	reset the peak resident set size of the process, so it measures from now on. Only on Linux
+
+	Returns:
+		True if reset
+	"""
+	try:
+		with open("/proc/self/clear_refs", "w") as f:
+			f.write("5")
+		return True
+	except OSError:
+		return False
+
+
+def max_rss():
+	"""
+	Returns:
+		peak resident set size of the process in bytes since it started, None if unknown
+	"""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return peak if sys.platform == "darwin" else peak * 1024
+
+
+class measure:
+	'''
+	memory use while processing one document
+	'''
+
+	def __enter__(self):
+		self.peak_reset = reset_peak_rss()
+		if self.monitor.trace:
+			tracemalloc.reset_peak()
+			self.traced_start = tracemalloc.get_traced_memory()[0]
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		record = {"input_bytes": self.input_bytes}
+		if self.monitor.trace:
+			current, peak = tracemalloc.get_traced_memory()
+			record["traced_peak"] = peak - self.traced_start
+			record["traced_retained"] = current - self.traced_start
+		status = read_status()
+		record["rss"] = status.get("VmRSS")
+		# the peak of this document if it could be reset, otherwise of the whole run so far
+		record["rss_peak"] = status.get("VmHWM") if self.peak_reset else max_rss()
+		self.monitor.add(self.key, record)
+		return False
+
+	def __init__(self, monitor, key, input_bytes):
+		self.monitor = monitor
+		self.key = key
+		self.input_bytes = input_bytes
+
+
+class no_measure:
+	'''
+	measure of a disabled memory_monitor, does nothing
+	'''
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+
+NO_MEASURE = no_measure()
+
+
+class memory_monitor:
+	'''
+	memory use per document, for sizing worker memory limits: the resident set size after each document and its peak
+	while processing it (per document on Linux, where the peak can be reset, otherwise the peak of the run so far),
+	and with trace, the peak and retained Python allocations measured by tracemalloc, which slows processing down.
+	Allocations of other threads, such as the output writer, are counted in the document they happen during.
+	'''
+
+	def add(self, key, record):
+		with self.lock:
+			self.records[key] = record
+
+	def document(self, key, paths=()):
+		"""
+		Args:
+			key: document name
+			paths: input files of the document, for relating memory to input size
+
+		Returns:
+			context manager measuring the memory used inside it
+		"""
+		if not self.enabled:
+			return NO_MEASURE
+		input_bytes = 0
+		for path in paths:
+			try:
+				input_bytes += os.path.getsize(path)
+			except OSError:
+				continue
+		return measure(self, key, input_bytes)
+
+	def summary(self, largest=10):
+		"""
+		Returns:
+			dict of the highest peaks, the highest ratio of traced peak to input size (None without trace, as the RSS
+			includes the memory of the whole process), and the documents with the highest peaks
+		"""
+		with self.lock:
+			records = dict(self.records)
+		peak = "traced_peak" if self.trace else "rss_peak"
+		ranked = sorted(records.items(), key=lambda item: -(item[1].get(peak) or 0))
+		ratios = [record["traced_peak"] / record["input_bytes"] for record in records.values()
+		          if record.get("traced_peak") and record["input_bytes"]]
+		return {
+			"documents": len(records),
+			"rss_peak_max": max((record["rss_peak"] or 0 for record in records.values()), default=0),
+			"traced_peak_max": max((record.get("traced_peak", 0) for record in records.values()), default=0),
+			"peak_per_input_byte_max": max(ratios) if ratios else None,
+			"largest": [dict(record, document=key) for key, record in ranked[:largest]]
+		}
+
+	def write_report(self, path, largest=10):
+		"""
+		write the summary and every document's record as JSON, sizes in bytes
+		"""
+		report = self.summary(largest)
+		with self.lock:
+			report["document_memory"] = dict(self.records)
+		with open(path, "w") as f:
+			json.dump(report, f, indent=2)
+
+	def close(self):
+		if self.trace and tracemalloc.is_tracing():
+			tracemalloc.stop()
+
+	def __init__(self, enabled=True, trace=False):
+		'''
+		:param enabled: measure, otherwise document does nothing
+		:param trace: trace Python allocations with tracemalloc
+		'''
+		self.enabled = enabled
+		self.trace = enabled and trace
+		self.lock = threading.Lock()
+		self.records = {}
+		if self.trace:
+			tracemalloc.start()
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+# counters of the cache, with its size
+COUNTERS = ("hits", "misses", "writes", "evictions", "size")
+
+
+class ocr_cache:
+	'''
+	on disk cache of OCR results keyed by the image pixels and everything that changes what tesseract returns
+	(language, config and OCR engine version). Entries are json files spread over 256 subdirectories, the least
+	recently used are evicted once the cache grows past max_bytes. Safe to share between threads, and between
+	processes as writes are atomic and sizes are re-read from disk before evicting.
+	'''
+
+	def key(self, img, kind, lang, config, version):
+		"""
+		build the cache key for an OCR call
+
+		Args:
+			img: image passed to tesseract, numpy array
+			kind: type of OCR output, e.g. 'text' or 'words'
+			lang: tesseract language
+			config: tesseract config string
+			version: version of the OCR engine, from its version method
+
+		Returns:
+			key: hex digest
+
+		"""
+		img = np.ascontiguousarray(img)
+		digest = hashlib.sha256()
+		digest.update("{}\0{}\0{}\0{}\0{}\0{}\0".format(
+			kind, lang, config, version, img.shape, img.dtype).encode("utf-8"))
+		digest.update(img.tobytes())
+		return digest.hexdigest()
+
+	def __path(self, key):
+		return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+	def get(self, key):
+		"""
+		Returns:
+			the cached value, or None on a miss
+
+		"""
+		path = self.__path(key)
+		try:
+			with open(path, "r", encoding="utf-8") as f:
+				value = json.load(f)
+			# mark as recently used for eviction
+			os.utime(path)
+		except (OSError, ValueError):
+			with self.lock:
+				self.misses += 1
+			return None
+		with self.lock:
+			self.hits += 1
+		return value
+
+	def put(self, key, value):
+		path = self.__path(key)
+		data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+		with open(tmp_path, "wb") as f:
+			f.write(data)
+		with self.lock:
+			# an entry written again replaces the old one rather than adding to the cache
+			try:
+				old_size = os.path.getsize(path)
+			except OSError:
+				old_size = 0
+			os.replace(tmp_path, path)
+			self.writes += 1
+			self.size += len(data) - old_size
+			if self.size > self.max_bytes:
+				self.__evict()
+
+	def __scan(self):
+		"""
+		Returns:
+			list of (last used time, size, path) for every cache entry on disk
+
+		"""
+		entries = []
+		for subdir in os.scandir(self.cache_dir):
+			if not subdir.is_dir():
+				continue
+			for entry in os.scandir(subdir.path):
+				if entry.name.endswith(".json"):
+					try:
+						stat = entry.stat()
+					except OSError:
+						continue
+					entries.append((stat.st_mtime, stat.st_size, entry.path))
+		return entries
+
+	def __evict(self):
+		# other processes may share the cache directory, so work from what is on disk
+		entries = sorted(self.__scan())
+		self.size = sum(entry[1] for entry in entries)
+		# evict down to 90% so eviction does not run again on the next write
+		target = self.max_bytes * 0.9
+		for mtime, size, path in entries:
+			if self.size <= target:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			self.size -= size
+			self.evictions += 1
+
+	def counts(self):
+		"""
+		Returns:
+			dict of the counters of the cache and its size in bytes, for add_counts
+		"""
+		with self.lock:
+			return {name: getattr(self, name) for name in COUNTERS}
+
+	def add_counts(self, counts):
+		"""
+		add counters, such as the change in those of a copy of the cache in a worker process
+		"""
+		with self.lock:
+			for name in COUNTERS:
+				setattr(self, name, getattr(self, name) + counts.get(name, 0))
+
+	def stats(self):
+		"""
+		Returns:
+			dict of cache hits, misses, hit rate, writes, evictions and current size
+
+		"""
+		with self.lock:
+			lookups = self.hits + self.misses
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": self.hits / lookups if lookups else 0.0,
+				"writes": self.writes,
+				"evictions": self.evictions,
+				"size_bytes": self.size
+			}
+
+	def __init__(self, cache_dir, max_bytes=1024 ** 3):
+		'''
+		:param cache_dir: directory holding the cache, created if missing
+		:param max_bytes: size the cache is kept under
+		'''
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.writes = 0
+		self.evictions = 0
+		os.makedirs(cache_dir, exist_ok=True)
+		self.size = sum(entry[1] for entry in self.__scan())
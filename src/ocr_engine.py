@@ -0,0 +1,272 @@
+import abc
+import hashlib
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+import pytesseract
+
+# message of the RuntimeError pytesseract raises when tesseract runs out of time
+PYTESSERACT_TIMEOUT = 'Tesseract process timeout'
+
+
+class ocr_timeout(RuntimeError):
+	'''
+	raised by an OCR engine call that ran out of time
+	'''
+
+
+class ocr_engine(abc.ABC):
+	'''
+	interface of the OCR engines used for table images. Engines read numpy images and are called from several
+	threads at once. Batch calls default to one call per image, engines with a per call overhead override them. An
+	engine missing one of the abstract methods cannot be created.
+	'''
+
+	name = None
+
+	@abc.abstractmethod
+	def image_to_text(self, img, config):
+		"""
+		Args:
+			img: image, numpy array
+			config: tesseract style config string, e.g. '--psm 6 --oem 3'
+
+		Returns:
+			text: recognised text, unprocessed
+
+		"""
+		pass
+
+	@abc.abstractmethod
+	def image_to_words(self, img, config):
+		"""
+		Returns:
+			words: list of recognised words as (text, x, y, w, h), not necessarily in reading order
+
+		"""
+		pass
+
+	def images_to_text(self, imgs, config):
+		"""
+		recognise several images with the same config
+
+		Returns:
+			texts: list of recognised texts, in the order of imgs
+
+		"""
+		return [self.image_to_text(img, config) for img in imgs]
+
+	@abc.abstractmethod
+	def version(self):
+		"""
+		Returns:
+			version string, part of the OCR cache key
+		"""
+		pass
+
+
+class tesseract_engine(ocr_engine):
+	'''
+	tesseract command line, one process per call through pytesseract. Batches run as a single process over a list of
+	images, so the process start up and model loading are paid once per batch.
+	'''
+
+	name = 'tesseract'
+
+	def __pytesseract(self, func, img, config, **kwargs):
+		try:
+			return func(img, lang=self.lang, config=config, timeout=self.timeout, **kwargs)
+		except RuntimeError as e:
+			if str(e) == PYTESSERACT_TIMEOUT:
+				raise ocr_timeout(str(e))
+			raise
+
+	def image_to_text(self, img, config):
+		return self.__pytesseract(pytesseract.image_to_string, img, config)
+
+	def image_to_words(self, img, config):
+		data = self.__pytesseract(pytesseract.image_to_data, img, config, output_type=pytesseract.Output.DICT)
+		words = []
+		for text, conf, x, y, w, h in zip(data['text'], data['conf'], data['left'], data['top'], data['width'], data['height']):
+			text = str(text).strip()
+			if text and float(conf) >= 0:
+				words.append((text, int(x), int(y), int(w), int(h)))
+		return words
+
+	def images_to_text(self, imgs, config):
+		if len(imgs) < 2:
+			return super().images_to_text(imgs, config)
+		with tempfile.TemporaryDirectory(prefix='tess_') as tmp_dir:
+			paths = []
+			for i, img in enumerate(imgs):
+				paths.append(os.path.join(tmp_dir, '{}.png'.format(i)))
+				cv2.imwrite(paths[-1], img)
+			list_path = os.path.join(tmp_dir, 'images.txt')
+			with open(list_path, 'w') as f:
+				f.write('\n'.join(paths) + '\n')
+			out_base = os.path.join(tmp_dir, 'out')
+			cmd = [pytesseract.pytesseract.tesseract_cmd, list_path, out_base, '-l', self.lang] + shlex.split(config)
+			try:
+				subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True,
+				               timeout=self.timeout * len(imgs) if self.timeout else None)
+			except subprocess.TimeoutExpired:
+				raise ocr_timeout(PYTESSERACT_TIMEOUT)
+			except subprocess.CalledProcessError as e:
+				raise pytesseract.TesseractError(e.returncode, e.stderr.decode('utf-8', 'ignore'))
+			with open(out_base + '.txt', encoding='utf-8') as f:
+				pages = f.read().split('\f')
+		# every page ends with a form feed, leaving an empty string after the last one
+		if len(pages) != len(imgs) + 1:
+			return super().images_to_text(imgs, config)
+		return pages[:-1]
+
+	def version(self):
+		if self.tesseract_version is None:
+			try:
+				self.tesseract_version = str(pytesseract.get_tesseract_version())
+			except Exception:
+				self.tesseract_version = "unknown"
+		return self.tesseract_version
+
+	def __init__(self, lang='eng', timeout=0):
+		'''
+		:param lang: tesseract language
+		:param timeout: seconds before a call is abandoned with ocr_timeout, per image for batches, 0 for no limit
+		'''
+		self.lang = lang
+		self.timeout = timeout
+		self.tesseract_version = None
+
+
+class tesserocr_engine(ocr_engine):
+	'''
+	tesseract in process through tesserocr, which must be installed separately. Avoids starting a process and loading
+	the model for every call. Each thread keeps its own tesseract instance, timeouts are not supported.
+	'''
+
+	name = 'tesserocr'
+
+	def __api(self, config):
+		api = getattr(self.local, 'api', None)
+		if api is None:
+			oem = re.search(r'--oem\s+(\d+)', config)
+			# tesserocr's OEM and PSM constants are the plain tesseract numbers
+			api = self.local.api = self.tesserocr.PyTessBaseAPI(
+				lang=self.lang, oem=int(oem.group(1)) if oem else self.tesserocr.OEM.DEFAULT)
+		psm = re.search(r'--psm\s+(\d+)', config)
+		api.SetPageSegMode(int(psm.group(1)) if psm else self.tesserocr.PSM.AUTO)
+		return api
+
+	def __set_image(self, api, img):
+		api.SetImage(self.Image.fromarray(img))
+
+	def image_to_text(self, img, config):
+		api = self.__api(config)
+		self.__set_image(api, img)
+		return api.GetUTF8Text()
+
+	def image_to_words(self, img, config):
+		api = self.__api(config)
+		self.__set_image(api, img)
+		api.Recognize()
+		words = []
+		level = self.tesserocr.RIL.WORD
+		iterator = api.GetIterator()
+		if iterator is None:
+			return words
+		for word in self.tesserocr.iterate_level(iterator, level):
+			text = word.GetUTF8Text(level)
+			box = word.BoundingBox(level)
+			if text and text.strip() and box is not None and word.Confidence(level) >= 0:
+				words.append((text.strip(), box[0], box[1], box[2] - box[0], box[3] - box[1]))
+		return words
+
+	def version(self):
+		return 'tesserocr ' + str(self.tesserocr.tesseract_version()).split('\n')[0]
+
+	def __init__(self, lang='eng', timeout=0):
+		'''
+		:param lang: tesseract language
+		:param timeout: ignored, calls run in process
+		'''
+		try:
+			import tesserocr
+			from PIL import Image
+		except ImportError:
+			raise ImportError("the tesserocr OCR engine needs the tesserocr package: pip install tesserocr")
+		self.tesserocr = tesserocr
+		self.Image = Image
+		self.lang = lang
+		self.local = threading.local()
+
+
+class stub_engine(ocr_engine):
+	'''
+	deterministic stand in for tesseract, for tests and for measuring image processing without OCR. Images without ink
+	read as empty, others as a short digest of their pixels. Optional sleeps model the cost of a real engine.
+	'''
+
+	name = 'stub'
+
+	def __text(self, img):
+		if not np.any(img < 128):
+			return ''
+		return 'ocr' + hashlib.sha1(np.ascontiguousarray(img).tobytes()).hexdigest()[:8]
+
+	def image_to_text(self, img, config):
+		return self.images_to_text([img], config)[0]
+
+	def image_to_words(self, img, config):
+		time.sleep(self.call_latency + self.image_latency)
+		# ink blobs joined horizontally stand for words
+		ink = (img < 128).view(np.uint8)
+		ink = cv2.dilate(ink, np.ones((3, 9), np.uint8))
+		n, labels, stats, centroids = cv2.connectedComponentsWithStats(ink, connectivity=8)
+		words = []
+		for x, y, w, h, area in sorted(stats[1:].tolist(), key=lambda box: (box[1], box[0])):
+			words.append((self.__text(img[y:y + h, x:x + w]), x, y, w, h))
+		return words
+
+	def images_to_text(self, imgs, config):
+		time.sleep(self.call_latency + self.image_latency * len(imgs))
+		return [self.__text(img) for img in imgs]
+
+	def version(self):
+		return 'stub'
+
+	def __init__(self, lang='eng', timeout=0, call_latency=0.0, image_latency=0.0):
+		'''
+		:param lang: ignored
+		:param timeout: ignored
+		:param call_latency: seconds slept once per call, as process start up and model loading
+		:param image_latency: seconds slept per image, as recognition
+		'''
+		self.call_latency = call_latency
+		self.image_latency = image_latency
+
+
+OCR_ENGINES = {engine.name: engine for engine in [tesseract_engine, tesserocr_engine, stub_engine]}
+
+
+def get_ocr_engine(name, lang='eng', timeout=0):
+	"""
+	create an OCR engine by name
+
+	Args:
+		name: 'tesseract', 'tesserocr' or 'stub'
+		lang: tesseract language
+		timeout: seconds before a call is abandoned, 0 for no limit
+
+	Returns:
+		ocr_engine
+
+	"""
+	if name not in OCR_ENGINES:
+		raise ValueError("unknown OCR engine: {}".format(name))
+	return OCR_ENGINES[name](lang=lang, timeout=timeout)
@@ -0,0 +1,58 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ocr_pool:
+	'''
+	bounded pool for OCR calls. Tesseract runs as an external process, so threads are enough to keep several
+	running at once. With a single worker calls run inline, exactly as without a pool.
+	'''
+
+	def submit(self, func, *args, **kwargs):
+		"""
+		schedule an OCR call
+
+		Args:
+			func: function to call
+			args, kwargs: arguments for func
+
+		Returns:
+			future: concurrent.futures.Future holding the result
+
+		"""
+		if self.executor is not None:
+			return self.executor.submit(func, *args, **kwargs)
+		future = Future()
+		try:
+			future.set_result(func(*args, **kwargs))
+		except Exception as e:
+			future.set_exception(e)
+		return future
+
+	def map(self, func, items):
+		"""
+		apply func to every item concurrently
+
+		Returns:
+			list of results in the order of items
+
+		"""
+		futures = [self.submit(func, *item) for item in items]
+		return [future.result() for future in futures]
+
+	def shutdown(self):
+		if self.executor is not None:
+			self.executor.shutdown(wait=True)
+			self.executor = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.shutdown()
+
+	def __init__(self, workers=1):
+		'''
+		:param workers: maximum number of OCR calls running at once
+		'''
+		self.workers = max(1, int(workers))
+		self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
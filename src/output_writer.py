@@ -0,0 +1,102 @@
+import os
+import queue
+import threading
+import time
+
+# buffer of output files, so the small chunks written by the serialisers reach the storage as few large writes
+WRITE_BUFFER = 1 << 20
+
+
+class output_writer:
+	'''
+	runs output jobs (serialising and writing an article) on a background thread fed by a bounded queue, so the next
+	article is extracted while the last one is written. The queue holds at most max_queue articles, beyond that
+	submit waits for the writer. Jobs run in the order submitted. An error in a job is raised again by the next submit
+	or by close, after the jobs already queued have run. With max_queue 0, jobs run at once in the calling thread.
+	'''
+
+	def makedirs(self, path):
+		"""
+		create a directory and its parents, remembering the directories already created
+		"""
+		if path not in self.dirs:
+			os.makedirs(path, exist_ok=True)
+			self.dirs.add(path)
+
+	def __run_job(self, func, args, kwargs):
+		start = time.perf_counter()
+		try:
+			func(*args, **kwargs)
+		except BaseException as e:
+			if self.error is None:
+				self.error = e
+		self.write_seconds += time.perf_counter() - start
+		self.jobs += 1
+
+	def __run(self):
+		while True:
+			job = self.queue.get()
+			if job is None:
+				break
+			self.__run_job(*job)
+
+	def __raise(self):
+		if self.error is not None:
+			error, self.error = self.error, None
+			raise error
+
+	def submit(self, func, *args, **kwargs):
+		"""
+		queue func(*args, **kwargs) to run on the writer thread
+		"""
+		self.__raise()
+		if self.thread is None:
+			self.__run_job(func, args, kwargs)
+			self.__raise()
+			return
+		start = time.perf_counter()
+		self.queue.put((func, args, kwargs))
+		self.wait_seconds += time.perf_counter() - start
+
+	def close(self):
+		"""
+		run the queued jobs and stop the writer thread. Called again, does nothing.
+		"""
+		if self.thread is not None and self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+		self.__raise()
+
+	def stats(self):
+		"""
+		Returns:
+			dict of jobs run, seconds spent writing and seconds submit waited for a full queue
+		"""
+		return {
+			"jobs": self.jobs,
+			"write_seconds": self.write_seconds,
+			"wait_seconds": self.wait_seconds
+		}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __init__(self, max_queue=8):
+		'''
+		:param max_queue: articles waiting to be written before submit blocks, 0 to write in the calling thread
+		'''
+		self.dirs = set()
+		self.error = None
+		self.jobs = 0
+		self.write_seconds = 0.0
+		self.wait_seconds = 0.0
+		self.queue = None
+		self.thread = None
+		if max_queue > 0:
+			self.queue = queue.Queue(max_queue)
+			# a daemon thread, so a failing main thread does not hang on it; close is registered at exit to flush
+			self.thread = threading.Thread(target=self.__run, name="output_writer", daemon=True)
+			self.thread.start()
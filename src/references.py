@@ -1,4 +1,7 @@
 import re
+from src.bioc_model import passage, section_type
+
+REFERENCES_SECTION = section_type([{"IAO_term": "references section", "IAO_id": "IAO:0000320"}])
 
 class references():
 
@@ -26,24 +29,13 @@ class references():
 		pass
 
 	def __create_reference_block(self, reference):
-		refSection = {
-			"section_heading": self.section_heading,
-			"subsection_heading": "",
-			"body": reference.get_text().replace("Go to:", ""),
-			"section_type": [
-				{
-					"IAO_term": "references section",
-					"IAO_id": "IAO:0000320"
-				}
-			]
-		}
-
+		infons = {}
 		for subsec in self.config['references']['sections']:
 			sect = reference.find(self.config['references']['sections'][subsec]['name'], self.config['references']['sections'][subsec]['attrs'])
 			if sect:
-				refSection[subsec] = sect.get_text()
+				infons[subsec] = sect.get_text()
 
-		return refSection
+		return passage(self.section_heading, "", reference.get_text().replace("Go to:", ""), REFERENCES_SECTION, infons or None)
 
 	def __init__(self, soup, config, section_heading):
 		self.config = config
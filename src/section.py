@@ -2,6 +2,8 @@ import json
 import re
 from src.utils import *
 from src.references import references
+from src.stage_timer import NO_TIMER
+from src.bioc_model import passage, section_type
 
 import nltk
 
@@ -32,12 +34,7 @@ class section:
 		pass
 
 	def __add_paragraph(self, body):
-		self.paragraphs.append({
-			"section_heading": self.section_heading,
-			"subsection_heading": self.subheader,
-			"body": body,
-			"section_type": self.section_type
-		})
+		self.paragraphs.append(passage(self.section_heading, self.subheader, body, self.section_type))
 
 	def __navigate_children(self, soup_section, all_sub_sections, filtered_paragraphs):
 		if soup_section in filtered_paragraphs:
@@ -97,7 +94,7 @@ class section:
 		else:
 			h2 = ''
 			mapping_result = []
-		self.section_type = mapping_result
+		self.section_type = section_type(mapping_result)
 
 	def __add_IAO(self, IAO_term):
 		paper = {}
@@ -161,10 +158,11 @@ class section:
 		for ref in all_references:
 			self.paragraphs.append(references(ref, self.config, self.section_heading).to_dict())
 
-	def __init__(self, config, soup_section):
+	def __init__(self, config, soup_section, timer=None):
 		self.config = config
 		self.section_heading = self.__get_section_header(soup_section)
-		self.__set_IAO()
+		with (timer or NO_TIMER).stage("iao_matching"):
+			self.__set_IAO()
 		self.subheader = ""
 		self.paragraphs = []
 		if self.section_heading == "Abbreviations":
@@ -0,0 +1,227 @@
+import json
+import sqlite3
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS articles (
+	id INTEGER PRIMARY KEY,
+	name TEXT NOT NULL UNIQUE,
+	file TEXT
+);
+CREATE TABLE IF NOT EXISTS passages (
+	id INTEGER PRIMARY KEY,
+	article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+	passage_index INTEGER NOT NULL,
+	offset INTEGER,
+	text TEXT,
+	infons TEXT
+);
+CREATE TABLE IF NOT EXISTS passage_sections (
+	passage_id INTEGER NOT NULL REFERENCES passages(id) ON DELETE CASCADE,
+	iao_id TEXT,
+	iao_term TEXT
+);
+CREATE TABLE IF NOT EXISTS passage_titles (
+	passage_id INTEGER NOT NULL REFERENCES passages(id) ON DELETE CASCADE,
+	level INTEGER NOT NULL,
+	title TEXT
+);
+CREATE TABLE IF NOT EXISTS article_tables (
+	id INTEGER PRIMARY KEY,
+	article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+	table_id TEXT,
+	title TEXT,
+	caption TEXT,
+	footer TEXT,
+	offset INTEGER
+);
+CREATE TABLE IF NOT EXISTS table_columns (
+	table_pk INTEGER NOT NULL REFERENCES article_tables(id) ON DELETE CASCADE,
+	column_index INTEGER NOT NULL,
+	heading TEXT
+);
+CREATE TABLE IF NOT EXISTS table_cells (
+	table_pk INTEGER NOT NULL REFERENCES article_tables(id) ON DELETE CASCADE,
+	section_index INTEGER NOT NULL,
+	section_title TEXT,
+	row_index INTEGER NOT NULL,
+	column_index INTEGER NOT NULL,
+	cell_id TEXT,
+	value
+);
+CREATE TABLE IF NOT EXISTS abbreviations (
+	article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+	list TEXT,
+	short TEXT,
+	long TEXT,
+	offset INTEGER
+);
+CREATE INDEX IF NOT EXISTS passages_article ON passages(article_id);
+CREATE INDEX IF NOT EXISTS passage_sections_passage ON passage_sections(passage_id);
+CREATE INDEX IF NOT EXISTS passage_sections_iao ON passage_sections(iao_id);
+CREATE INDEX IF NOT EXISTS passage_titles_passage ON passage_titles(passage_id);
+CREATE INDEX IF NOT EXISTS passage_titles_title ON passage_titles(title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS article_tables_article ON article_tables(article_id);
+CREATE INDEX IF NOT EXISTS table_columns_table ON table_columns(table_pk);
+CREATE INDEX IF NOT EXISTS table_columns_heading ON table_columns(heading COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS table_cells_table ON table_cells(table_pk);
+CREATE INDEX IF NOT EXISTS abbreviations_article ON abbreviations(article_id);
+CREATE INDEX IF NOT EXISTS abbreviations_short ON abbreviations(short);
+'''
+
+# passage types of table documents which are columns of article_tables rather than passages
+TABLE_TEXT_TYPES = {'table_title': 'title', 'table_caption': 'caption', 'table_footer': 'footer'}
+
+
+class sqlite_corpus:
+	'''
+	corpus output as a normalised SQLite database: articles, main text passages with their IAO section types and
+	section titles, tables with their column headings and cells, and abbreviations, indexed for queries by IAO id,
+	article, section title, column heading and abbreviation. Articles are committed in batches of batch_size, written
+	again they replace their earlier rows. Each process should open its own sqlite_corpus, they share the database
+	file through WAL journaling. Safe to share between threads.
+
+	e.g. all methods section passages:
+	SELECT a.name, p.text FROM passages p JOIN passage_sections s ON s.passage_id = p.id
+	JOIN articles a ON a.id = p.article_id WHERE s.iao_id = 'IAO:0000317'
+	'''
+
+	def __article(self, name, file):
+		self.db.execute("DELETE FROM articles WHERE name = ?", (name,))
+		return self.db.execute("INSERT INTO articles (name, file) VALUES (?, ?)", (name, file)).lastrowid
+
+	def __main_text(self, article_id, main_text):
+		for document in main_text.get('documents', []):
+			for passage in document.get('passages', []):
+				infons = passage.get('infons', {})
+				passage_id = self.db.execute(
+					"INSERT INTO passages (article_id, passage_index, offset, text, infons) VALUES (?, ?, ?, ?, ?)",
+					(article_id, self.passage_index, passage.get('offset'), passage.get('text'),
+					 json.dumps(infons, ensure_ascii=False))).lastrowid
+				self.passage_index += 1
+				self.db.executemany("INSERT INTO passage_sections (passage_id, iao_id, iao_term) VALUES (?, ?, ?)", [
+					(passage_id, section.get('IAO_id'), section.get('IAO_term', section.get('IAO_name')))
+					for section in infons.get('section_type', [])])
+				self.db.executemany("INSERT INTO passage_titles (passage_id, level, title) VALUES (?, ?, ?)", [
+					(passage_id, int(key[len('section_title_'):]), title) for key, title in infons.items()
+					if key.startswith('section_title_') and key[len('section_title_'):].isdigit()])
+
+	def __tables(self, article_id, tables):
+		for document in tables.get('documents', []):
+			texts = dict.fromkeys(TABLE_TEXT_TYPES.values())
+			grids = []
+			for passage in document.get('passages', []):
+				types = [section.get('type') for section in passage.get('infons', {}).get('section_type', [])]
+				if 'columns' in passage or 'results_section' in passage:
+					grids.append(passage)
+				for passage_type in types:
+					if passage_type in TABLE_TEXT_TYPES and passage.get('text'):
+						column = TABLE_TEXT_TYPES[passage_type]
+						texts[column] = passage['text'] if texts[column] is None else texts[column] + ' ' + passage['text']
+			offset = document['passages'][0].get('offset') if document.get('passages') else None
+			for grid in grids or [None]:
+				table_pk = self.db.execute(
+					"INSERT INTO article_tables (article_id, table_id, title, caption, footer, offset) VALUES (?, ?, ?, ?, ?, ?)",
+					(article_id, document.get('id'), texts['title'], texts['caption'], texts['footer'],
+					 grid.get('offset') if grid else offset)).lastrowid
+				if grid is None:
+					continue
+				self.db.executemany("INSERT INTO table_columns (table_pk, column_index, heading) VALUES (?, ?, ?)", [
+					(table_pk, i, heading if isinstance(heading, str) else json.dumps(heading, ensure_ascii=False))
+					for i, heading in enumerate(grid.get('columns', []))])
+				cells = []
+				row_index = 0
+				for section_index, section in enumerate(grid.get('results_section', [])):
+					for row in section.get('results_rows', []):
+						for column_index, cell in enumerate(row):
+							value = cell.get('text')
+							if not isinstance(value, (str, int, float)) and value is not None:
+								value = json.dumps(value, ensure_ascii=False)
+							cells.append((table_pk, section_index, section.get('section_title_1'), row_index, column_index,
+							              cell.get('id'), value))
+						row_index += 1
+				self.db.executemany(
+					"INSERT INTO table_cells (table_pk, section_index, section_title, row_index, column_index, cell_id, value) "
+					"VALUES (?, ?, ?, ?, ?, ?, ?)", cells)
+
+	def __abbreviations(self, article_id, abbreviations):
+		rows = []
+		for document in abbreviations.get('documents', []):
+			for passage in document.get('passages', []):
+				short, sep, long = (passage.get('text') or '').partition('|')
+				rows.append((article_id, document.get('id'), short, long if sep else None, passage.get('offset')))
+		self.db.executemany("INSERT INTO abbreviations (article_id, list, short, long, offset) VALUES (?, ?, ?, ?, ?)",
+		                    rows)
+
+	def write(self, name, main_text=None, tables=None, abbreviations=None, file=None):
+		"""
+		add an article, replacing it if already in the database. Nothing of the article is written if it raises an error
+
+		Args:
+			name: article name, unique in the corpus, e.g. PMC4827154 or sub/PMC4827154
+			main_text: BioC dict of the main text
+			tables: BioC dict of the tables
+			abbreviations: BioC dict of the abbreviations
+			file: source file of the article
+
+		"""
+		with self.lock:
+			if not self.db.in_transaction:
+				self.db.execute("BEGIN")
+			# an article failing part way leaves none of its rows, nor removes its earlier ones
+			self.db.execute("SAVEPOINT article")
+			try:
+				self.passage_index = 0
+				article_id = self.__article(name, file)
+				if main_text:
+					self.__main_text(article_id, main_text)
+				if tables:
+					self.__tables(article_id, tables)
+				if abbreviations:
+					self.__abbreviations(article_id, abbreviations)
+			except Exception:
+				self.db.execute("ROLLBACK TO article")
+				self.db.execute("RELEASE article")
+				raise
+			self.db.execute("RELEASE article")
+			self.records += 1
+			self.pending += 1
+			if self.pending >= self.batch_size:
+				self.__commit()
+
+	def __commit(self):
+		self.db.commit()
+		self.pending = 0
+
+	def commit(self):
+		with self.lock:
+			self.__commit()
+
+	def close(self):
+		with self.lock:
+			self.__commit()
+			self.db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __init__(self, path, batch_size=100, timeout=60):
+		'''
+		:param path: database file, created with the schema if missing
+		:param batch_size: articles written per transaction
+		:param timeout: seconds to wait for other processes holding the database lock
+		'''
+		self.path = path
+		self.batch_size = batch_size
+		self.lock = threading.Lock()
+		self.records = 0
+		self.pending = 0
+		self.passage_index = 0
+		self.db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+		self.db.execute("PRAGMA journal_mode = WAL")
+		self.db.execute("PRAGMA synchronous = NORMAL")
+		self.db.execute("PRAGMA foreign_keys = ON")
+		self.db.executescript(SCHEMA)
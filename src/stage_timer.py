@@ -0,0 +1,224 @@
+import csv
+import json
+import threading
+import time
+
+# processing stages, in the order they are reported
+STAGES = ['config_load', 'file_read', 'soup_parse', 'hidden_strip', 'table_extraction', 'section_extraction',
+          'iao_matching', 'dag_assignment', 'abbreviations', 'soup_release', 'bioc_format', 'serialise_write']
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(values, p):
+	"""
+	Returns:
+		nearest rank percentile p of values, sorted ascending
+	"""
+	if not values:
+		return 0.0
+	rank = max(1, -(-len(values) * p // 100))
+	return values[int(rank) - 1]
+
+
+class no_stage:
+	'''
+	stage of a disabled timer, does nothing
+	'''
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+
+NO_STAGE = no_stage()
+
+
+class stage:
+	'''
+	a timed stage, nested stages are subtracted so each stage records only its own time
+	'''
+
+	def __enter__(self):
+		stack = self.timer.stack()
+		stack.append(self)
+		if self.timer.on_stage is not None:
+			self.timer.on_stage(self.name)
+		self.child_wall = self.child_cpu = 0.0
+		self.wall = time.perf_counter()
+		self.cpu = time.thread_time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		wall = time.perf_counter() - self.wall
+		cpu = time.thread_time() - self.cpu
+		stack = self.timer.stack()
+		stack.pop()
+		if stack:
+			stack[-1].child_wall += wall
+			stack[-1].child_cpu += cpu
+		# after an error the stage it happened in stays the current one
+		if self.timer.on_stage is not None and exc_type is None:
+			self.timer.on_stage(stack[-1].name if stack else None)
+		self.timer.add(self.name, wall - self.child_wall, cpu - self.child_cpu)
+		return False
+
+	def __init__(self, timer, name):
+		self.timer = timer
+		self.name = name
+
+
+class document:
+	'''
+	sets the document the stages timed in this thread belong to
+	'''
+
+	def __enter__(self):
+		self.previous = getattr(self.timer.local, 'document', None)
+		self.timer.local.document = self.name
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.timer.local.document = self.previous
+		return False
+
+	def __init__(self, timer, name):
+		self.timer = timer
+		self.name = name
+
+
+class stage_timer:
+	'''
+	records the wall clock and CPU time of each processing stage for every document. Stages are timed with
+	"with timer.stage(name):" inside "with timer.document(name):", which may be on different threads. CPU time is
+	that of the thread running the stage. When disabled, stage and document return a shared object doing nothing,
+	unless there is an on_stage callback, which stages are still followed for.
+	'''
+
+	def stack(self):
+		stack = getattr(self.local, 'stack', None)
+		if stack is None:
+			stack = self.local.stack = []
+		return stack
+
+	def add(self, name, wall, cpu):
+		if not self.enabled:
+			return
+		doc = getattr(self.local, 'document', None)
+		with self.lock:
+			record = self.records.setdefault(doc, {}).setdefault(name, [0.0, 0.0, 0])
+			record[0] += wall
+			record[1] += cpu
+			record[2] += 1
+
+	def stage(self, name):
+		return stage(self, name) if self.enabled or self.on_stage is not None else NO_STAGE
+
+	def document(self, name):
+		return document(self, name) if self.enabled else NO_STAGE
+
+	def pop_document(self, name):
+		"""
+		Returns:
+			the stage records of a document, removed from the timer, for passing them to another process's timer
+		"""
+		with self.lock:
+			return self.records.pop(name, {})
+
+	def add_document(self, name, records):
+		"""
+		add stage records from pop_document to those of a document
+		"""
+		with self.lock:
+			stages = self.records.setdefault(name, {})
+			for stage_name, record in records.items():
+				total = stages.setdefault(stage_name, [0.0, 0.0, 0])
+				for i, value in enumerate(record):
+					total[i] += value
+
+	def __records(self):
+		"""
+		Returns:
+			copy of the records, and the names of the stages in them in report order
+		"""
+		with self.lock:
+			records = {doc: {name: list(record) for name, record in stages.items()} for doc, stages in self.records.items()}
+		names = [name for name in STAGES if any(name in stages for stages in records.values())]
+		others = {name for stages in records.values() for name in stages if name not in STAGES}
+		return records, names + sorted(others)
+
+	def summary(self, slowest=10):
+		"""
+		Returns:
+			dict with the total, mean and percentile wall time and the CPU time of each stage over documents, and
+			the slowest documents with their stage times, in seconds
+		"""
+		records, names = self.__records()
+		stages = {}
+		for name in names:
+			walls = sorted(record[name][0] for record in records.values() if name in record)
+			stats = {
+				"documents": len(walls),
+				"wall_total": sum(walls),
+				"cpu_total": sum(record[name][1] for record in records.values() if name in record),
+				"wall_mean": sum(walls) / len(walls),
+				"wall_max": walls[-1]
+			}
+			for p in PERCENTILES:
+				stats["wall_p{}".format(p)] = percentile(walls, p)
+			stages[name] = stats
+		totals = sorted(((sum(record[0] for record in records[doc].values()), doc) for doc in records),
+		                key=lambda total: -total[0])
+		return {
+			"documents": len(records),
+			"stages": stages,
+			"slowest": [
+				{
+					"document": doc,
+					"wall": wall,
+					"stages": {name: records[doc][name][0] for name in records[doc]}
+				}
+				for wall, doc in totals[:slowest]
+			]
+		}
+
+	def write_report(self, path, slowest=10):
+		"""
+		write the timings, as CSV with a row per document and the wall and CPU time of each stage if path ends in
+		.csv, otherwise as JSON with the summary and every document's stage times
+		"""
+		records, names = self.__records()
+		if path.endswith(".csv"):
+			with open(path, "w", newline="") as f:
+				writer = csv.writer(f)
+				writer.writerow(["document", "wall", "cpu"] + [name + suffix for name in names for suffix in ["_wall", "_cpu"]])
+				for doc, stages in records.items():
+					row = [doc, sum(record[0] for record in stages.values()), sum(record[1] for record in stages.values())]
+					for name in names:
+						row += stages[name][:2] if name in stages else [0.0, 0.0]
+					writer.writerow(row)
+			return
+		report = self.summary(slowest)
+		report["document_stages"] = {
+			doc: {name: {"wall": record[0], "cpu": record[1], "calls": record[2]} for name, record in stages.items()}
+			for doc, stages in records.items()
+		}
+		with open(path, "w") as f:
+			json.dump(report, f, indent=2)
+
+	def __init__(self, enabled=True, on_stage=None):
+		'''
+		:param enabled: record timings, otherwise timing does nothing
+		:param on_stage: called in the thread running a stage with the name of the stage it enters, and of the stage
+			returned to (None at the top) when it ends without an error, for following the progress of a document
+		'''
+		self.enabled = enabled
+		self.on_stage = on_stage
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.records = {}
+
+
+# timer used when none is given
+NO_TIMER = stage_timer(enabled=False)
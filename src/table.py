@@ -1,7 +1,10 @@
 import re
 from itertools import product
 import warnings
-from datetime import datetime
+from src.cell_normaliser import cell_normaliser
+from src.column_typer import column_typer
+from src.table_context import table_context
+from src.bioc_model import collection, table_document
 
 
 
@@ -51,18 +54,7 @@ class table:
 				colspan = int(cell.attrs['colspan'])
 				# next column is offset by the colspan
 				span_offset += colspan - 1
-				value = ''.join(str(x) for x in cell.contents)
-				# value = cell.get_text()
-				# clean the cell
-				value = value.strip().replace('\u2009',' ')
-				value = re.sub("<\/?span[^>\n]*>?|<hr\/>?", "", value)
-				if value.startswith('(') and value.endswith(')'):
-					value = value[1:-1]
-				if re.match(self.pval_regex,value):
-					value = re.sub(r'(\s{0,1})[*××xX](\s{0,1})10(_{0,1})','e',value).replace('−', '-')
-				if re.match(self.pval_scientific_regex,value):
-					value = re.sub(r'(\s{0,1})[–−-](\s{0,1})','-',value)
-					value = re.sub(r'(\s{0,1})[eE]','e',value)
+				value = self.cell_normaliser.normalise(cell)
 				for drow, dcol in product(range(rowspan), range(colspan)):
 					try:
 						table[row_idx + drow][col_idx + dcol] = value
@@ -213,54 +205,6 @@ class table:
 					idx_list.append(idx)
 		return idx_list
 
-	def __is_number(self, s):
-		"""
-		check if input string is a number
-
-		Args:
-			s: input string
-
-		Returns:
-			True/False
-
-		"""
-		try:
-			float(s.replace(',',''))
-			return True
-		except ValueError:
-			return False
-
-	def __is_mix(self, s):
-		"""
-		check if input string is a mix of number and text
-
-		Args:
-			s: input string
-
-		Returns:
-			True/False
-
-		"""
-		if any(char.isdigit() for char in s):
-			if any(char for char in s if char.isdigit()==False):
-				return True
-		return False
-
-	def __is_text(self, s):
-		"""
-		check if input string is all text
-
-		Args:
-			s: input string
-
-		Returns:
-			True/False
-
-		"""
-		if any(char.isdigit() for char in s):
-			return False
-		return True
-
 	def __table2json(self, table_2d, header_idx, subheader_idx, superrow_idx, table_num, title, footer, caption):
 		"""
 		transform tables from nested lists to JSON
@@ -287,12 +231,19 @@ class table:
 		pre_superrow = None
 		cur_header = ''
 		cur_superrow = ''
+		header_rows = set(header_idx)
+		superrow_rows = set(superrow_idx)
+		# map each header row to the first run of consecutive header rows containing it
+		header_runs = {}
+		for run in subheader_idx:
+			for i in run:
+				header_runs.setdefault(i, run)
 		for row_idx,row in enumerate(table_2d):
 			if not any([i for i in row if i not in ['','None']]):
 				continue
-			if row_idx in header_idx:
-				cur_header = [table_2d[i] for i in [i for i in subheader_idx if row_idx in i][0]]
-			elif row_idx in superrow_idx:
+			if row_idx in header_rows:
+				cur_header = [table_2d[i] for i in header_runs[row_idx]]
+			elif row_idx in superrow_rows:
 				cur_superrow = [i for i in row if i not in ['','None']][0]
 			else:
 				if cur_header!=pre_header:
@@ -323,128 +274,18 @@ class table:
 		return tables
 
 	def __reformat_table_json(self, table_json):
-		bioc_format = {
-			"source": "Auto-CORPus table processing",
-			"date": f'{datetime.today().strftime("%Y%m%d")}',
-			"key": "auto-corpus-table.key",
-			"infons": {},
-			"documents":[]
-		}
-
+		bioc_format = collection("Auto-CORPus table processing", "auto-corpus-table.key")
 		for table in table_json['tables']:
-			offset = 0
-			tableDict = {
-				"file": self.file_name,
-				"id": F"T{self.tableIdentifier if self.tableIdentifier else table['identifier']}",
-				"infons": {},
-				"passages":[
-					{
-						"offset": 0,
-						"infons":{
-							"section_type": [
-								{"type": "table_title",
-								"IAO_name": "document title",
-								 "IAO_id": "IAO:0000305"
-								 }
-							]
-						},
-						"text": table['title'],
-						"sentences": [],
-						"annotations": [],
-						"relations": []
-					}
-				],
-				"annotations": [],
-				"relations": []
-			}
-			offset += len(table['title'])
-			if "caption" in table.keys():
-				tableDict['passages'].append(
-					{
-						"offset": offset,
-						"infons":{
-							"section_type":[
-								{
-									"type": "table_caption",
-									"IAO_name": "caption",
-									"IAO_id": "IAO:0000304"
-								}
-							]
-						},
-						"text": ". ".join(table["caption"]),
-						"sentences": [],
-						"annotations": [],
-						"relations": []
-					}
-				)
-				offset += len("".join(table["caption"]))
-
-			if "section" in table.keys():
-				rowID = 0
-				colID = 0
-				rsection = []
-				this_offset = offset
-				for sect in table["section"]:
-
-					resultsDict = 						{
-						"section_title_1": sect['section_name'],
-						"results_rows":[]
-					}
-					for resultrow in sect["results"]:
-						colID=0
-						rrow = []
-						for result in resultrow:
-							resultDict = {
-								"id": F"T{table['identifier']}.{rowID}.{colID}",
-								"text": result
-							}
-							colID+=1
-							offset+= len(str(result))
-							rrow.append(resultDict)
-						resultsDict["results_rows"].append(rrow)
-						rowID+=1
-					rsection.append(resultsDict)
-				tableDict['passages'].append(
-					{
-						"offset": this_offset,
-						"infons": {
-							"section_type": [
-								{
-									"type": "table",
-									"IAO_name": "table",
-									"IAO_id": "IAO:0000306"
-								}
-							]
-						},
-						"columns": table.get("columns", []),
-						"results_section": rsection,
-						"sentences": [],
-						"annotations": [],
-						"relations": []
-					}
-				)
-
-			if "footer" in table.keys():
-				tableDict['passages'].append(
-					{
-						"offset": offset,
-						"infons":{
-							"section_type":[
-								{
-									"type": "table_footer",
-									"IAO_name": "caption",
-									"IAO_id": "IAO:0000304"
-								}
-							]
-						},
-						"text": ". ".join(table["footer"]),
-						"sentences": [],
-						"annotations": [],
-						"relations": []
-					}
-				)
-				offset += len("".join(table["footer"]))
-			bioc_format["documents"].append(tableDict)
+			bioc_format.documents.append(table_document(
+				self.file_name,
+				F"T{self.tableIdentifier if self.tableIdentifier else table['identifier']}",
+				F"T{table['identifier']}",
+				table['title'],
+				table["caption"] if "caption" in table.keys() else None,
+				table.get("columns", []),
+				[(sect['section_name'], sect['results']) for sect in table.get("section", [])],
+				table["footer"] if "footer" in table.keys() else None
+			))
 		return bioc_format
 
 	def __main(self, soup, config):
@@ -461,22 +302,25 @@ class table:
 				warnings.warn("Table {} has no data rows".format(i))
 		soup_tables = [soup_tables[i] for i in range(len(soup_tables)) if i not in pop_list]
 
+		# locate title, caption and footer candidates once for all tables
+		context = table_context(soup, soup_tables, config)
+
 		# One table
 		tables = []
 		for table_num, table in enumerate(soup_tables):
 			# caption and footer
 			try:
-				caption = table.find_previous(config['table_title']['name'],config['table_title']['attrs']).get_text()
+				caption = context.title(table).get_text()
 			except:
 				caption = ''
 				# warnings.warn("Unable to find table caption")
 			try:
-				footer = [i.get_text() for i in table.parent.find_next_siblings(config['table_footer']['name'],config['table_footer']['attrs'])]
+				footer = [i.get_text() for i in context.footers(table)]
 			except:
 				footer = ''
 				# warnings.warn("Unable to find table footer")
 			try:
-				actual_caption = [i.get_text() for i in table.find_previous(config['table_caption']['name'], config['table_caption']['attrs'])]
+				actual_caption = [i.get_text() for i in context.caption(table)]
 			except:
 				actual_caption = ''
 				# warnings.warn("Unable to find actual table caption caption")
@@ -492,67 +336,38 @@ class table:
 			table_2d = self.__table_to_2d(table,config)
 
 			# find superrows
+			header_rows = set(header_idx)
 			superrow_idx = []
 			if table_2d!=None:
 				for row_idx,row in enumerate(table_2d):
-					if row_idx not in header_idx:
+					if row_idx not in header_rows:
 						if self.__check_superrow(row):
 							superrow_idx.append(row_idx)
 
 			# identify section names in index column
 			if superrow_idx==[]:
-				first_col = [row[0] for row in table_2d]
-				first_col_vals = [i for i in first_col if first_col.index(i) not in header_idx]
+				first_idx = {}
+				for row_idx,row in enumerate(table_2d):
+					first_idx.setdefault(row[0], row_idx)
+				first_col_vals = [row[0] for row in table_2d if first_idx[row[0]] not in header_rows]
 				unique_vals = set([i for i in first_col_vals if i not in ['','None']])
 				if len(unique_vals)<=len(first_col_vals)/2:
-					section_names = list(unique_vals)
-					for i in section_names:
-						superrow_idx.append(first_col.index(i))
+					# insert a section row before the first occurrence of each section name and drop the index column
+					section_starts = {first_idx[i]: i for i in unique_vals}
 					n_cols = len(table_2d[0])
-					for idx,val in zip(superrow_idx, section_names):
-						table_2d = table_2d[:idx]+[[val]*n_cols]+table_2d[idx:]
-					#update superrow_idx after superrow insertion
-					superrow_idx = []
-					first_col = [row[0] for row in table_2d]
-					for i in section_names:
-						superrow_idx.append(first_col.index(i))
-					for row in table_2d:
-						row.pop(0)
+					new_table_2d = []
+					for row_idx,row in enumerate(table_2d):
+						if row_idx in section_starts:
+							superrow_idx.append(len(new_table_2d))
+							new_table_2d.append([section_starts[row_idx]]*(n_cols-1))
+						new_table_2d.append(row[1:])
+					table_2d = new_table_2d
 
 			# Identify subheaders
-			value_idx = [i for i in range(len(table_2d)) if i not in header_idx+superrow_idx]
-			col_type = []
-			for col_idx in range(len(table_2d[0])):
-				cur_col = [i[col_idx] for i in table_2d]
-				num_cnt = 0
-				txt_cnt = 0
-				mix_cnt = 0
-				for cell in cur_col:
-					cell = str(cell).lower()
-					if cell in ['none', '', '-',]:
-						continue
-					elif self.__is_number(cell):
-						num_cnt+=1
-					elif self.__is_mix(cell):
-						mix_cnt+=1
-					elif self.__is_text(cell):
-						txt_cnt+=1
-				if max(num_cnt,txt_cnt,mix_cnt)==num_cnt:
-					col_type.append('num')
-				elif max(num_cnt,txt_cnt,mix_cnt)==txt_cnt:
-					col_type.append('txt')
-				else:
-					col_type.append('mix')
-			subheader_idx = []
-			for row_idx in value_idx:
-				cur_row = table_2d[row_idx]
-				unmatch_cnt = 0
-				for col_idx in range(len(cur_row)):
-					cell = str(cur_row[col_idx]).lower()
-					if self.__is_text(cell) and col_type[col_idx]!='txt' and cell not in ['none', '', '-',]:
-						unmatch_cnt+=1
-				if unmatch_cnt>=len(cur_row)/2:
-					subheader_idx.append(row_idx)
+			skip_rows = header_rows.union(superrow_idx)
+			value_idx = [i for i in range(len(table_2d)) if i not in skip_rows]
+			typer = column_typer(table_2d)
+			subheader_idx = typer.subheader_rows(value_idx)
 			header_idx+=subheader_idx
 
 			subheader_idx = []
@@ -566,12 +381,7 @@ class table:
 			subheader_idx.append(tmp)
 
 			# convert to float
-			for row in table_2d:
-				for cell in range(len(row)):
-					try:
-						row[cell] = float(row[cell].replace('−','-').replace('–','-').replace(',',''))
-					except:
-						row[cell] = row[cell]
+			typer.convert(table_2d)
 
 			cur_table = self.__table2json(table_2d, header_idx, subheader_idx, superrow_idx, table_num, caption, footer, actual_caption)
 			# merge headers
@@ -600,10 +410,12 @@ class table:
 		self.tableIdentifier=None
 		if re.search("_table_\d+\.html", file_name):
 			self.tableIdentifier = file_name.split("/")[-1].split("_")[-1].split(".")[0]
-		self.pval_regex = r'((\d+\.\d+)|(\d+))(\s?)[*××xX](\s{0,1})10[_]{0,1}([–−-])(\d+)'
-		self.pval_scientific_regex = r'((\d+.\d+)|(\d+))(\s{0,1})[eE](\s{0,1})([–−-])(\s{0,1})(\d+)'
+		self.cell_normaliser = cell_normaliser()
 		self.tables = self.__main(soup, config)
 		pass
 
+	def to_collection(self):
+		return self.tables
+
 	def to_dict(self):
-		return self.tables
\ No newline at end of file
+		return self.tables.as_dict()
\ No newline at end of file
@@ -0,0 +1,94 @@
+from bisect import bisect_left
+
+
+class table_context:
+	'''
+	indexes the table title, caption and footer elements of a document once, in document order, so each table can be
+	matched to them by position instead of searching the tree again for every table
+	'''
+
+	def __find_candidates(self, soup, config, key):
+		"""
+		find all elements matching a table config rule
+
+		Args:
+			soup: BeautifulSoup object of html
+			config: configuration dictionary
+			key: config rule to match
+
+		Returns:
+			list of matching elements in document order
+
+		"""
+		try:
+			return soup.find_all(config[key]['name'], config[key]['attrs'])
+		except KeyError:
+			return []
+
+	def __index(self, soup, soup_tables, config):
+		"""
+		record the document position of every table, table parent and candidate element
+
+		Args:
+			soup: BeautifulSoup object of html
+			soup_tables: tables to be matched
+			config: configuration dictionary
+
+		"""
+		titles = self.__find_candidates(soup, config, 'table_title')
+		captions = self.__find_candidates(soup, config, 'table_caption')
+		footers = self.__find_candidates(soup, config, 'table_footer')
+
+		wanted = set(id(el) for el in titles + captions + footers)
+		wanted.update(id(t) for t in soup_tables)
+		wanted.update(id(t.parent) for t in soup_tables if t.parent is not None)
+		# the document root is the parent of top level tables but not one of its own descendants
+		self.positions = {id(soup): -1}
+		for pos, el in enumerate(soup.descendants):
+			if id(el) in wanted:
+				self.positions[id(el)] = pos
+
+		self.titles = titles
+		self.title_positions = [self.positions[id(el)] for el in titles]
+		self.captions = captions
+		self.caption_positions = [self.positions[id(el)] for el in captions]
+		# footers are siblings of the table's parent, so group them by their own parent
+		self.footers_by_parent = {}
+		for el in footers:
+			positions, elements = self.footers_by_parent.setdefault(id(el.parent), ([], []))
+			positions.append(self.positions[id(el)])
+			elements.append(el)
+
+	def __nearest_previous(self, positions, elements, table):
+		"""
+		find the last element starting before the table, the indexed equivalent of table.find_previous
+
+		Returns:
+			element or None
+
+		"""
+		idx = bisect_left(positions, self.positions[id(table)]) - 1
+		return elements[idx] if idx >= 0 else None
+
+	def title(self, table):
+		return self.__nearest_previous(self.title_positions, self.titles, table)
+
+	def caption(self, table):
+		return self.__nearest_previous(self.caption_positions, self.captions, table)
+
+	def footers(self, table):
+		"""
+		find the footers following the table's parent, the indexed equivalent of table.parent.find_next_siblings
+
+		Returns:
+			list of footer elements
+
+		"""
+		parent = table.parent
+		if parent is None or parent.parent is None:
+			return []
+		positions, elements = self.footers_by_parent.get(id(parent.parent), ([], []))
+		return elements[bisect_left(positions, self.positions[id(parent)] + 1):]
+
+	def __init__(self, soup, soup_tables, config):
+		self.__index(soup, soup_tables, config)
@@ -2,17 +2,50 @@
 # -*- coding: utf-8 -*-
 
 import cv2
-import pytesseract
+import numpy as np
 from operator import itemgetter
 import json
 import os
 import time
 import re
-from datetime import datetime
+import warnings
+from collections import deque
+from src.ocr_engine import get_ocr_engine, ocr_engine as ocr_engine_base, ocr_timeout
+from src.ocr_pool import ocr_pool
+from src.bioc_model import collection, table_document
+
+# change the 'lang' here for different traineddata
+OCR_LANG = 'eng'
+CELL_OCR_CONFIG = '--psm 6 --oem 3'
+# sparse text mode finds words anywhere in the image, their order is restored from the cells
+IMAGE_OCR_CONFIG = '--psm 11 --oem 3'
+# ruling lines closer than this many pixels are one line (e.g. double rules)
+GRID_MIN_GAP = 4
+# share of a cell side a ruling line must cover to separate two cells
+GRID_MIN_COVERAGE = 0.5
+# connected components of fewer pixels are noise, not text
+BLANK_MIN_AREA = 4
 
 
 class table_image:
 
+	def __cached(self, img, kind, config, ocr):
+		'''
+		Function: look an OCR result up in the cache before running OCR, and store it afterwards
+		Input: image passed to the OCR engine, type of result, engine config, function running the OCR
+		Output: OCR result, and the number of OCR engine calls made for it
+		'''
+
+		if self.ocr_cache is None:
+			return ocr(), 1
+		key = self.ocr_cache.key(img, kind, OCR_LANG, config, self.engine.version())
+		result = self.ocr_cache.get(key)
+		if result is not None:
+			return result, 0
+		result = ocr()
+		self.ocr_cache.put(key, result)
+		return result, 1
+
 	def img2text(self, img, x, y, w, h):
 		'''
 		Function: translate image into texts
@@ -20,45 +53,235 @@ class table_image:
 		Output: extracted texts
 		'''
 
-		ROI = img[y - 3:(y + h + 6), x - 3:(x + w + 6)]
-		# pytesseract.pytesseract.tesseract_cmd = 'D:/Tesseract/tesseract.exe'
-		# change the 'lang' here for different traineddata
-		text = pytesseract.image_to_string(ROI, lang='eng', config='--psm 6 --oem 3').strip()
-		new_text = text.replace("\n", " ")
-		return new_text
+		return self.img2texts(img, [(x, y, w, h)])[0]
 
 
 
-	def rm_lines(self, img):
+	def img2texts(self, img, boxes):
 		'''
-		Function: remove all the horizontal and vertical lines in image and binary it
-		Input: original image
-		Output: image after preprocessing
+		Function: translate several text boxes of an image into texts with one batch call to the OCR engine
+		Input: original image, and locations of text boxes
+		Output: extracted texts, in the order of boxes
 		'''
 
-		gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-		binary = cv2.adaptiveThreshold(~gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 35, -5)
+		return self.__read_texts(img, boxes)[0]
+
+
+
+	def __read_texts(self, img, boxes):
+		'''
+		Function: img2texts, also counting the OCR engine calls, none if every box was in the cache
+		Input: original image, and locations of text boxes
+		Output: extracted texts, in the order of boxes, and the number of OCR engine calls made
+		'''
+
+		ROIs = [img[y - 3:(y + h + 6), x - 3:(x + w + 6)] for (x, y, w, h) in boxes]
+		texts = [None] * len(ROIs)
+		keys = [None] * len(ROIs)
+		if self.ocr_cache is not None:
+			for i, ROI in enumerate(ROIs):
+				keys[i] = self.ocr_cache.key(ROI, 'text', OCR_LANG, CELL_OCR_CONFIG, self.engine.version())
+				texts[i] = self.ocr_cache.get(keys[i])
+		missing = [i for i, text in enumerate(texts) if text is None]
+		if missing:
+			# pytesseract.pytesseract.tesseract_cmd = 'D:/Tesseract/tesseract.exe'
+			try:
+				read = self.engine.images_to_text([ROIs[i] for i in missing], CELL_OCR_CONFIG)
+			except ocr_timeout:
+				x, y = boxes[missing[0]][:2]
+				if len(missing) == 1:
+					warnings.warn("OCR timed out for cell at {}, {}".format(x, y))
+				else:
+					warnings.warn("OCR timed out for {} cells from {}, {}".format(len(missing), x, y))
+				read = None
+			for n, i in enumerate(missing):
+				if read is None:
+					texts[i] = ''
+					continue
+				texts[i] = read[n]
+				if self.ocr_cache is not None:
+					self.ocr_cache.put(keys[i], texts[i])
+		return [text.strip().replace("\n", " ") for text in texts], 1 if missing else 0
+
+
+
+	def is_blank(self, img, x, y, w, h):
+		'''
+		Function: decide from pixel statistics whether a cell holds no text, so OCR can be skipped
+		Input: processed image, and location of the text box
+		Output: True if the share of ink in the cell crop is at most blank_threshold, or none of its connected
+		components is text: all are noise specks or fragments of ruling lines
+		'''
+
+		if self.blank_threshold < 0:
+			return False
+		# same crop as img2text
+		ink = img[y - 3:(y + h + 6), x - 3:(x + w + 6)] < 128
+		n_ink = np.count_nonzero(ink)
+		if n_ink <= self.blank_threshold * ink.size:
+			return True
+		n, labels, stats, centroids = cv2.connectedComponentsWithStats(ink.view(np.uint8), connectivity=8)
+		# label 0 is the background
+		widths, heights, areas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+		rows, cols = ink.shape
+		rules = ((widths >= cols * 0.8) & (heights <= max(3, rows // 10))) | \
+			((heights >= rows * 0.8) & (widths <= max(3, cols // 10)))
+		return not np.any((areas >= BLANK_MIN_AREA) & ~rules)
+
+
+
+	def img2words(self, img):
+		'''
+		Function: translate a whole image into words with a single OCR call
+		Input: image
+		Output: list of recognised words as (text, x, y, w, h), in OCR reading order
+		'''
+
+		return self.__read_words(img)[0]
+
+
+
+	def __read_words(self, img):
+		'''
+		Function: img2words, also counting the OCR engine calls
+		Input: image
+		Output: list of recognised words, and the number of OCR engine calls made, 0 if the words were in the cache
+		'''
+
+		try:
+			words, calls = self.__cached(img, 'words', IMAGE_OCR_CONFIG, lambda: self.engine.image_to_words(img, IMAGE_OCR_CONFIG))
+		except ocr_timeout:
+			# every cell falls back to per cell OCR
+			warnings.warn("OCR timed out for whole image")
+			return [], 1
+		# cached words come back as lists
+		return [tuple(word) for word in words], calls
+
+
+
+	def words2cells(self, words, cells):
+		'''
+		Function: assign words to the cell they overlap most, using the same margins as img2text crops
+		Input: words from img2words, cell locations
+		Output: dict of cell location to cell text, cells without words are left out
+		'''
+
+		if not words or not cells:
+			return {}
+		boxes = np.array([word[1:] for word in words], dtype=np.int64)
+		rects = np.array(cells, dtype=np.int64)
+		# intersection of every word box (rows) with every cell crop (columns)
+		left = np.maximum(boxes[:, 0:1], (rects[:, 0] - 3)[None, :])
+		right = np.minimum((boxes[:, 0] + boxes[:, 2])[:, None], (rects[:, 0] + rects[:, 2] + 6)[None, :])
+		top = np.maximum(boxes[:, 1:2], (rects[:, 1] - 3)[None, :])
+		bottom = np.minimum((boxes[:, 1] + boxes[:, 3])[:, None], (rects[:, 1] + rects[:, 3] + 6)[None, :])
+		overlap = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+		best = overlap.argmax(axis=1)
+		# a word must lie mostly inside a cell, text outside any cell (e.g. between rules) is dropped
+		word_area = np.maximum(boxes[:, 2] * boxes[:, 3], 1)
+		assigned = overlap[np.arange(len(words)), best] * 2 >= word_area
+
+		cell_words = {}
+		for word, cell_idx, keep in zip(words, best, assigned):
+			if keep:
+				cell_words.setdefault(cells[cell_idx], []).append(word)
+		return {cell: ' '.join(word[0] for word in self.reading_order(cell_word_list))
+		        for cell, cell_word_list in cell_words.items()}
+
+
+
+	def reading_order(self, words):
+		'''
+		Function: put the words of a cell in reading order, sparse text OCR returns them in no particular order
+		Input: words as (text, x, y, w, h)
+		Output: words sorted by line, top to bottom, and within a line by x. A word starts a new line when its
+		vertical centre is below the bottom of the line so far
+		'''
+
+		lines = []
+		bottom = None
+		for word in sorted(words, key=lambda word: (word[2], word[1])):
+			if bottom is None or word[2] + word[4] / 2 > bottom:
+				lines.append([])
+				bottom = word[2] + word[4]
+			else:
+				bottom = max(bottom, word[2] + word[4])
+			lines[-1].append(word)
+		return [word for line in lines for word in sorted(line, key=lambda word: word[1])]
+
+
+
+	def __buffer(self, name, shape):
+		'''
+		Function: reuse a preallocated working buffer across images of the same size
+		Input: buffer name, shape
+		Output: uint8 array, its previous contents are not cleared
+		'''
+
+		buf = self.buffers.get(name)
+		if buf is None or buf.shape != shape:
+			buf = np.empty(shape, dtype=np.uint8)
+			self.buffers[name] = buf
+		return buf
+
+
+
+	def line_masks(self, gray):
+		'''
+		Function: detect the horizontal and vertical lines of a grayscale image
+		Input: grayscale image
+		Output: masks of the horizontal and of the vertical lines, widened by dilation, and the binary image they were
+		found in, only valid until the next call as their buffers are reused
+		'''
+
+		binary = cv2.bitwise_not(gray, dst=self.__buffer('inverted', gray.shape))
+		binary = cv2.adaptiveThreshold(binary, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 35, -5,
+		                               dst=self.__buffer('binary', gray.shape))
 		# binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, -5)
 		rows, cols = binary.shape
+		eroded = self.__buffer('lines_eroded', gray.shape)
 
 		# detect horizontal lines
 		scale = 40
 		kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (cols // scale, 1))
-		eroded = cv2.erode(binary, kernel, iterations=1)
-		dilatedcol = cv2.dilate(eroded, kernel, iterations=2)
+		eroded = cv2.erode(binary, kernel, dst=eroded, iterations=1)
+		dilatedcol = cv2.dilate(eroded, kernel, dst=self.__buffer('dilated_col', gray.shape), iterations=2)
 
 		# detect vertical lines
 		scale = 20
 		kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, rows // scale))
-		eroded = cv2.erode(binary, kernel, iterations=1)
-		dilatedrow = cv2.dilate(eroded, kernel, iterations=2)
+		eroded = cv2.erode(binary, kernel, dst=eroded, iterations=1)
+		dilatedrow = cv2.dilate(eroded, kernel, dst=self.__buffer('dilated_row', gray.shape), iterations=2)
+
+		return dilatedcol, dilatedrow, binary
+
 
+
+	def line_mask(self, gray):
+		'''
+		Function: detect the horizontal and vertical lines of a grayscale image
+		Input: grayscale image
+		Output: mask of the lines, only valid until the next call as its buffer is reused
+		'''
+
+		dilatedcol, dilatedrow, binary = self.line_masks(gray)
 		# merge two groups of lines
-		merge = cv2.add(dilatedcol, dilatedrow)
+		merge = cv2.add(dilatedcol, dilatedrow, dst=self.__buffer('lines', gray.shape))
 		# comment the next line to save image with detected lines
 		# cv2.imwrite("lines.jpg", merge)
+		return merge
+
+
+
+	def rm_lines(self, img):
+		'''
+		Function: remove all the horizontal and vertical lines in image and binary it
+		Input: original image
+		Output: image after preprocessing
+		'''
 
-		after = cv2.add(gray, merge)
+		gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+		after = cv2.add(gray, self.line_mask(gray))
 		# comment the next line to save borderless table images
 		# cv2.imwrite("borderless.jpg", after)
 
@@ -66,6 +289,192 @@ class table_image:
 
 
 
+	def __filter_cells(self, contours, size, min_area):
+		'''
+		Function: keep the contours which look like table cells, and sort them from top-left to bottom-right
+		Input: contours, shape of the padded image, smallest cell area
+		Output: ordered table cells
+		'''
+
+		# 'cells' save the location and sort
+		cells = []
+		for c in contours:
+			x, y, w, h = cv2.boundingRect(c)
+			# case 1：eliminate rectangles that are too thin (might be lines)
+			if w > h * 20 or h > w * 20:
+				continue
+			# case 2：remove a box similar to the whole image
+			if (w > size[1] * 0.8) and (h > size[0] * 0.8):
+				continue
+
+			# case 3: eliminate small boxes that could be noises
+			area = cv2.contourArea(c)
+			# method 1: constant area. Does not work on images that are too large or too small
+			if area < min_area:
+				continue
+			# method 2: proportional area
+			# if area > 0:
+			#     if imgarea / area > 20000:
+			#         continue
+
+			cells.append((x, y, w, h))
+
+		# To avoid location errors in one line
+		return sorted(cells, key=itemgetter(1, 0))
+
+
+
+	def __line_runs(self, profile):
+		'''
+		Function: find the ruling lines in a projection profile
+		Input: projection profile of a line mask, non zero where a line is drawn
+		Output: array of (start, end) of each line
+		'''
+
+		change = np.diff(np.concatenate(([0], (profile > 0).view(np.int8), [0])))
+		starts = np.flatnonzero(change == 1)
+		ends = np.flatnonzero(change == -1)
+		if len(starts):
+			# merge lines separated by fewer than GRID_MIN_GAP pixels
+			keep = np.concatenate(([True], starts[1:] - ends[:-1] >= GRID_MIN_GAP))
+			starts = starts[keep]
+			ends = np.concatenate((ends[np.flatnonzero(keep)[1:] - 1], ends[-1:]))
+		return np.stack((starts, ends), axis=1)
+
+
+
+	def __close_grid(self, runs, drawn, extent):
+		'''
+		Function: add the edges of the grid where no line is drawn, at the extent of the lines running the other way
+		Input: ruling lines, where each line is drawn, indices covered by the lines running the other way
+		Output: ruling lines and where they are drawn, added edges are empty lines
+		'''
+
+		lo, hi = extent[0], extent[-1] + 1
+		if runs[0][0] - lo >= GRID_MIN_GAP:
+			runs = np.concatenate(([[lo, lo]], runs))
+			drawn = np.concatenate((np.zeros((1, drawn.shape[1]), bool), drawn))
+		if hi - runs[-1][1] >= GRID_MIN_GAP:
+			runs = np.concatenate((runs, [[hi, hi]]))
+			drawn = np.concatenate((drawn, np.zeros((1, drawn.shape[1]), bool)))
+		return runs, drawn
+
+
+
+	def __line_coverage(self, drawn, bands):
+		'''
+		Function: measure how much of each band every inner ruling line covers
+		Input: where each ruling line of one direction is drawn, bands of the other direction
+		Output: matrix of covered share, inner lines by bands
+		'''
+
+		# cumulative sums give the drawn length over any band
+		inner = drawn[1:-1]
+		drawn = np.concatenate((np.zeros((len(inner), 1), np.int64), np.cumsum(inner, axis=1)), axis=1)
+		lengths = np.maximum(bands[:, 1] - bands[:, 0], 1)
+		return (drawn[:, bands[:, 1]] - drawn[:, bands[:, 0]]) / lengths
+
+
+
+	def grid_cells(self, horizontal, vertical, binary):
+		'''
+		Function: find the cells of a ruled table from the row and column projection profiles of its line masks.
+		Neighbouring cells whose separating line is not drawn are merged into one spanning cell
+		Input: masks of the horizontal and vertical lines from line_masks, and the binary image they were found in
+		Output: cells as (x, y, w, h) in mask coordinates and the first and last row of the grid, or None if the lines
+		do not form a grid
+		'''
+
+		rows = self.__line_runs(horizontal.max(axis=1))
+		cols = self.__line_runs(vertical.max(axis=0))
+		if not len(rows) or not len(cols):
+			return None
+		# dilation lengthens the masks past the drawn lines, keep only the drawn pixels along each line
+		h_drawn = np.stack([np.logical_and(horizontal[a:b], binary[a:b]).any(axis=0) for a, b in rows])
+		v_drawn = np.stack([np.logical_and(vertical[:, a:b], binary[:, a:b]).any(axis=1) for a, b in cols])
+		h_extent = np.flatnonzero(h_drawn.any(axis=0))
+		v_extent = np.flatnonzero(v_drawn.any(axis=0))
+		if not len(h_extent) or not len(v_extent):
+			return None
+		rows, h_drawn = self.__close_grid(rows, h_drawn, v_extent)
+		cols, v_drawn = self.__close_grid(cols, v_drawn, h_extent)
+
+		# bands are the spaces between consecutive lines
+		row_bands = np.stack((rows[:-1, 1], rows[1:, 0]), axis=1)
+		col_bands = np.stack((cols[:-1, 1], cols[1:, 0]), axis=1)
+		n_rows, n_cols = len(row_bands), len(col_bands)
+		if n_rows * n_cols < 2:
+			return None
+
+		# cell (r, c) is numbered r * n_cols + c, cells are merged across missing lines with union-find
+		parent = list(range(n_rows * n_cols))
+
+		def find(i):
+			while parent[i] != i:
+				parent[i] = parent[parent[i]]
+				i = parent[i]
+			return i
+
+		v_missing = self.__line_coverage(v_drawn, row_bands) < GRID_MIN_COVERAGE
+		for k, r in zip(*np.nonzero(v_missing)):
+			parent[find(r * n_cols + k + 1)] = find(r * n_cols + k)
+		h_missing = self.__line_coverage(h_drawn, col_bands) < GRID_MIN_COVERAGE
+		for k, c in zip(*np.nonzero(h_missing)):
+			parent[find((k + 1) * n_cols + c)] = find(k * n_cols + c)
+
+		boxes = {}
+		for r in range(n_rows):
+			for c in range(n_cols):
+				root = find(r * n_cols + c)
+				x0, x1 = col_bands[c]
+				y0, y1 = row_bands[r]
+				box = boxes.get(root)
+				boxes[root] = (x0, y0, x1, y1) if box is None else \
+					(min(box[0], x0), min(box[1], y0), max(box[2], x1), max(box[3], y1))
+		if len(boxes) < 2:
+			return None
+		cells = [(int(x0), int(y0), int(x1 - x0), int(y1 - y0)) for x0, y0, x1, y1 in boxes.values()]
+		return cells, int(rows[0][0]), int(rows[-1][1])
+
+
+
+	def __strip_cells(self, thresh, kernel, min_area, y0, y1):
+		'''
+		Function: find cells by erosion and contours in a horizontal strip of the image, used for the title and footer
+		around a ruled grid
+		Input: processed image without padding, erosion kernel, smallest cell area, rows of the strip
+		Output: cells in padded image coordinates
+		'''
+
+		if y1 - y0 < 1:
+			return []
+		eroded = cv2.erode(thresh[y0:y1], kernel, iterations=3)
+		eroded = cv2.copyMakeBorder(eroded, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+		contours, hierarchy = cv2.findContours(eroded, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+		# the strip takes the place of the whole image when removing boxes around everything
+		return [(x, y + y0, w, h) for (x, y, w, h) in self.__filter_cells(contours, eroded.shape, min_area)]
+
+
+
+	def __grid_or_contour_cells(self, thresh, horizontal, vertical, binary, kernel, min_area):
+		'''
+		Function: find cells with the grid detector, the text above and below the grid (title and footer) is found
+		with contours
+		Input: processed image without padding, line masks and their binary image, erosion kernel, smallest cell area
+		Output: ordered cells in padded image coordinates, or None if there is no ruled grid
+		'''
+
+		grid = self.grid_cells(horizontal, vertical, binary)
+		if grid is None:
+			return None
+		cells, top, bottom = grid
+		cells = [(x + 10, y + 10, w, h) for (x, y, w, h) in cells]
+		cells += self.__strip_cells(thresh, kernel, min_area, 0, top)
+		cells += self.__strip_cells(thresh, kernel, min_area, bottom, thresh.shape[0])
+		return sorted(cells, key=itemgetter(1, 0))
+
+
+
 	def find_cells(self, img):
 		'''
 		Function: find cells in table images and sort them from top-left to bottom-right
@@ -79,7 +488,10 @@ class table_image:
 		imgarea = size[0] * size[1]
 
 		# gray = cv2.cvtColor(added, cv2.COLOR_BGR2GRAY)
-		gray = self.rm_lines(img)
+		# same as rm_lines, keeping the line masks for the grid detector
+		gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+		horizontal, vertical, binary = self.line_masks(gray)
+		gray = cv2.add(gray, cv2.add(horizontal, vertical))
 		ret, thresh = cv2.threshold(gray, 190, 255, cv2.THRESH_BINARY)
 		# thresh2 = cv2.adaptiveThreshold(gray,255,cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,10,0)
 		# comment the next line to save binary tables
@@ -90,6 +502,12 @@ class table_image:
 		# the second parameter of kernel and morphology iterations /
 		# need to be fine-tuned according to the image size
 		kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (cols // scale, rows // scale + 2))
+		if self.cell_detector == 'grid':
+			cells = self.__grid_or_contour_cells(thresh, horizontal, vertical, binary, kernel, 250)
+			if cells is not None:
+				thresh = cv2.copyMakeBorder(thresh, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+				return cells, added, thresh
+
 		# Another method for erosion
 		# eroded = cv2.morphologyEx(thresh, cv2.MORPH_GRADIENT, kernel, iterations=3)
 		# eroded = cv2.bitwise_not(eroded)
@@ -103,40 +521,76 @@ class table_image:
 		thresh = cv2.copyMakeBorder(thresh, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=[255, 255, 255])
 		contours, hierarchy = cv2.findContours(eroded, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
-		# 'cells' save the location and sort
-		cells = []
-		for c in contours:
-			x, y, w, h = cv2.boundingRect(c)
-			# case 1：eliminate rectangles that are too thin (might be lines)
-			if w > h * 20 or h > w * 20:
-				continue
-			# case 2：remove a box similar to the whole image
-			if (w > size[1] * 0.8) and (h > size[0] * 0.8):
-				continue
-
-			# case 3: eliminate small boxes that could be noises
-			area = cv2.contourArea(c)
-			# method 1: constant area. Does not work on images that are too large or too small
-			if area < 250:
-				continue
-			# method 2: proportional area
-			# if area > 0:
-			#     if imgarea / area > 20000:
-			#         continue
-
-			cells.append((x, y, w, h))
-
-		# To avoid location errors in one line
-		cells = sorted(cells, key=itemgetter(1, 0))
+		cells = self.__filter_cells(contours, size, 250)
 
 		return cells, added, thresh
 
 
 
-	def cell2table(self, cells, added, thresh, target_dir, pmc):
+	def find_cells_lean(self, gray):
+		'''
+		Function: find cells in a grayscale table image. Lines and cells of scans larger than max_side are detected
+		on a downscaled copy and the cells mapped back, padding is written once into a white buffer instead of
+		copying each image, and working buffers are reused across images of the same size
+		Input: grayscale image
+		Output: ordered table cells, None in place of the padded colour image, and processed image
+		'''
+
+		rows, cols = gray.shape
+		scale = min(1.0, self.max_side / max(rows, cols))
+		if scale < 1:
+			small_size = (max(1, int(round(cols * scale))), max(1, int(round(rows * scale))))
+			small = cv2.resize(gray, small_size, dst=self.__buffer('small', small_size[::-1]), interpolation=cv2.INTER_AREA)
+		else:
+			small = gray
+
+		# remove lines at full resolution for OCR, scaling up the mask found on the small image
+		horizontal, vertical, binary = self.line_masks(small)
+		mask = cv2.add(horizontal, vertical, dst=self.__buffer('lines', small.shape))
+		if scale < 1:
+			# area averaging leaves faint partial pixels along the lines, widen the mask to cover them
+			mask = cv2.dilate(mask, np.ones((3, 3), np.uint8), dst=self.__buffer('small_mask', small.shape))
+			small_after = cv2.add(small, mask, dst=self.__buffer('small_after', small.shape))
+			mask = cv2.resize(mask, (cols, rows), dst=self.__buffer('mask', gray.shape), interpolation=cv2.INTER_NEAREST)
+		after = cv2.add(gray, mask, dst=self.__buffer('after', gray.shape))
+		if scale == 1:
+			small_after = after
+
+		# the padded threshold image is handed to OCR, which may still be reading it while the next image is
+		# prepared, so it is not a reused buffer
+		thresh = np.full((rows + 20, cols + 20), 255, dtype=np.uint8)
+		cv2.threshold(after, 190, 255, cv2.THRESH_BINARY, dst=self.__buffer('thresh', gray.shape))
+		thresh[10:rows + 10, 10:cols + 10] = self.buffers['thresh']
+		if scale < 1:
+			small_thresh = cv2.threshold(small_after, 190, 255, cv2.THRESH_BINARY, dst=self.__buffer('small_thresh', small.shape))[1]
+		else:
+			small_thresh = self.buffers['thresh']
+
+		small_rows, small_cols = small_thresh.shape
+		kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (small_cols // 150, small_rows // 150 + 2))
+		cells = None
+		if self.cell_detector == 'grid':
+			cells = self.__grid_or_contour_cells(small_thresh, horizontal, vertical, binary, kernel, 250 * scale * scale)
+		if cells is None:
+			eroded = self.__buffer('eroded', (small_rows + 20, small_cols + 20))
+			eroded.fill(255)
+			eroded[10:small_rows + 10, 10:small_cols + 10] = cv2.erode(
+				small_thresh, kernel, dst=self.__buffer('small_eroded', small_thresh.shape), iterations=3)
+			contours, hierarchy = cv2.findContours(eroded, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+			cells = self.__filter_cells(contours, eroded.shape, 250 * scale * scale)
+
+		if scale < 1:
+			# back to padded full resolution coordinates
+			cells = sorted([(int(round((x - 10) / scale)) + 10, int(round((y - 10) / scale)) + 10,
+			                 int(round(w / scale)), int(round(h / scale))) for (x, y, w, h) in cells], key=itemgetter(1, 0))
+		return cells, None, thresh
+
+
+
+	def cell2table(self, cells, added, thresh, target_dir, pmc, words=None):
 		'''
 		Function: save table texts in several rows
-		Input: ordered table cells, and processed image
+		Input: ordered table cells, and processed image, and the words of the image if already read in 'image' mode
 		Output: table text saved line by line
 		'''
 
@@ -147,7 +601,8 @@ class table_image:
 
 		for (i, (x, y, w, h)) in enumerate(cells):
 			# print(x, y, w, h)
-			cv2.rectangle(added, (x, y), (x + w, y + h), color, 1)
+			if added is not None:
+				cv2.rectangle(added, (x, y), (x + w, y + h), color, 1)
 			row.append(cells[i])
 
 			# the last cell, footer or normal cell
@@ -195,10 +650,39 @@ class table_image:
 			table_row.append(new_row)
 		'''
 
+		# whole image mode reads every cell from one tesseract call, cells it finds no words in are read one by one
+		cell_text = {}
+		words_calls = 0
+		if self.ocr_mode == 'image':
+			if words is None:
+				words, words_calls = self.__read_words(thresh)
+			cell_text = self.words2cells(words, cells)
+
+		# cells are read concurrently in batches of ocr_batch, results are put back in row and column order
+		to_read = []
+		self.blank_cells = 0
 		for row in table_row:
 			row.sort(key=lambda x: x[0])
 			for (i, (x, y, w, h)) in enumerate(row):
-				row[i] = self.img2text(thresh, x, y, w, h)
+				text = cell_text.get(row[i])
+				if text:
+					row[i] = text
+				elif self.is_blank(thresh, x, y, w, h):
+					row[i] = ''
+					self.blank_cells += 1
+				else:
+					to_read.append((row, i))
+		jobs = []
+		for start in range(0, len(to_read), self.ocr_batch):
+			batch = to_read[start:start + self.ocr_batch]
+			jobs.append((batch, self.pool.submit(self.__read_texts, thresh, [row[i] for row, i in batch])))
+		# OCR engine calls made, batches read from the cache are not counted
+		self.cell_ocr_calls = words_calls
+		for batch, job in jobs:
+			texts, calls = job.result()
+			self.cell_ocr_calls += calls
+			for (row, i), text in zip(batch, texts):
+				row[i] = text
 
 		# cv2.imwrite(target_dir + '/' + "{}_result.jpg".format(pmc), added)
 
@@ -293,144 +777,116 @@ class table_image:
 		return table
 
 	def __reformat_table_json(self, table):
+		return table_document(
+			self.file_name,
+			self.tableIdentifier,
+			F"T{table['identifier']}",
+			table['title'],
+			table["caption"] if "caption" in table.keys() else None,
+			table.get("columns", []),
+			[(sect['section_name'], sect['results']) for sect in table.get("section", [])],
+			table["footer"] if "footer" in table.keys() else None
+		)
+
+	def __read_image(self, image_path, flags):
+		'''
+		Function: decode an image, from the bytes in image_data if already read
+		Input: image file path, cv2.IMREAD flags
+		Output: image, numpy array
+		'''
+		if image_path in self.image_data:
+			return cv2.imdecode(np.frombuffer(self.image_data[image_path], np.uint8), flags)
+		return cv2.imread(image_path, flags)
 
-		offset = 0
-		tableDict = {
-			"file": self.file_name,
-			"id": self.tableIdentifier,
-			"infons": {},
-			"passages":[
-				{
-					"offset": 0,
-					"infons":{
-						"section_type": [
-							{"type": "table_title",
-							 "IAO_name": "document title",
-							 "IAO_id": "IAO:0000305"
-							 }
-						]
-					},
-					"text": table['title'],
-					"sentences": [],
-					"annotations": [],
-					"relations": []
-				}
-			],
-			"annotations": [],
-			"relations": []
-		}
-		offset += len(table['title'])
-		if "caption" in table.keys():
-			tableDict['passages'].append(
-				{
-					"offset": offset,
-					"infons":{
-						"section_type":[
-							{
-								"type": "table_caption",
-								"IAO_name": "caption",
-								"IAO_id": "IAO:0000304"
-							}
-						]
-					},
-					"text": ". ".join(table["caption"]),
-					"sentences": [],
-					"annotations": [],
-					"relations": []
-				}
-			)
-			offset += len("".join(table["caption"]))
-
-		if "section" in table.keys():
-			rowID = 0
-			colID = 0
-			rsection = []
-			this_offset = offset
-			for sect in table["section"]:
-
-				resultsDict = 						{
-					"section_title_1": sect['section_name'],
-					"results_rows":[]
-				}
-				for resultrow in sect["results"]:
-					colID=0
-					rrow = []
-					for result in resultrow:
-						resultDict = {
-							"id": F"T{table['identifier']}.{rowID}.{colID}",
-							"text": result
-						}
-						colID+=1
-						offset+= len(str(result))
-						rrow.append(resultDict)
-					resultsDict["results_rows"].append(rrow)
-					rowID+=1
-				rsection.append(resultsDict)
-			tableDict['passages'].append(
-				{
-					"offset": this_offset,
-					"infons": {
-						"section_type": [
-							{
-								"type": "table",
-								"IAO_name": "table",
-								"IAO_id": "IAO:0000306"
-							}
-						]
-					},
-					"columns": table.get("columns", []),
-					"results_section": rsection,
-					"sentences": [],
-					"annotations": [],
-					"relations": []
-				}
-			)
-
-		if "footer" in table.keys():
-			tableDict['passages'].append(
-				{
-					"offset": offset,
-					"infons":{
-						"section_type":[
-							{
-								"type": "table_footer",
-								"IAO_name": "caption",
-								"IAO_id": "IAO:0000304"
-							}
-						]
-					},
-					"text": ". ".join(table["footer"]),
-					"sentences": [],
-					"annotations": [],
-					"relations": []
-				}
-			)
-			offset += len("".join(table["footer"]))
-		return tableDict
-
-	def __init__(self, table_images):
-		self.table_raw = []
-		self.tables = {
-			"source": "Auto-CORPus table processing",
-			"date": f'{datetime.today().strftime("%Y%m%d")}',
-			"key": "auto-corpus-table.key",
-			"infons": {},
-			"documents":[]
-		}
-		for image_path in table_images:
-			imgname = image_path.split('/')[-1]
-			self.tableIdentifier = "T"+imgname.split("_")[-1].split(".")[0]
-			self.file_name = imgname
-			pmc = imgname[0:imgname.rfind('.')]
-
-			img = cv2.imread(image_path)
+	def __prepare_image(self, image_path):
+		'''
+		Function: find the cells of an image and start its whole image OCR in 'image' mode
+		Input: image file path
+		Output: everything cell2table needs for the image
+		'''
 
+		if self.preprocess == 'lean':
+			cells, added, thresh = self.find_cells_lean(self.__read_image(image_path, cv2.IMREAD_GRAYSCALE))
+		else:
+			img = self.__read_image(image_path, cv2.IMREAD_COLOR)
 			cells, added, thresh = self.find_cells(img)
-			table_row = self.cell2table(cells, added, thresh, "imagesOut", pmc)
-			self.tables['documents'].append(self.__reformat_table_json(self.text2json(table_row)))
+		words = self.pool.submit(self.__read_words, thresh) if self.ocr_mode == 'image' else None
+		return image_path, cells, added, thresh, words
+
+	def __process_image(self, image_path, cells, added, thresh, words):
+		imgname = image_path.split('/')[-1]
+		self.tableIdentifier = "T"+imgname.split("_")[-1].split(".")[0]
+		self.file_name = imgname
+		pmc = imgname[0:imgname.rfind('.')]
+
+		words, words_calls = words.result() if words is not None else (None, 0)
+		table_row = self.cell2table(cells, added, thresh, "imagesOut", pmc, words)
+		self.tables.documents.append(self.__reformat_table_json(self.text2json(table_row)))
+		if self.ocr_report is not None:
+			self.ocr_report[image_path] = {
+				"cells": len(cells),
+				"ocr_calls": self.cell_ocr_calls + words_calls,
+				"blank_cells_skipped": self.blank_cells
+			}
+
+	def __init__(self, table_images, ocr_mode='cell', ocr_workers=1, ocr_timeout=0, ocr_cache=None, preprocess='full',
+	             max_side=2000, cell_detector='contour', blank_threshold=-1.0, ocr_report=None, ocr_engine='tesseract',
+	             ocr_batch=1, image_data=None):
+		'''
+		:param table_images: list of table image file paths
+		:param ocr_mode: 'cell' runs tesseract once per cell, 'image' runs it once per image and assigns the words to
+			cells, falling back to per cell OCR for cells without words
+		:param ocr_workers: maximum number of tesseract processes running at once
+		:param ocr_timeout: seconds before a single tesseract call is abandoned and its cell left empty, 0 for no limit
+		:param ocr_cache: ocr_cache consulted before running tesseract, shared across runs to skip repeated images
+		:param preprocess: 'full' finds cells on the full resolution colour image, 'lean' decodes to grayscale and
+			finds lines and cells on a copy downscaled to max_side pixels (see find_cells_lean)
+		:param max_side: longest side, in pixels, of the image used for line and cell detection in 'lean' mode
+		:param cell_detector: 'contour' finds cells as blobs of text after erosion, 'grid' reads the cells of ruled
+			tables from the projection profiles of the ruling lines and falls back to 'contour' when there is no grid
+		:param blank_threshold: cells whose share of ink is at most this, or whose ink is only specks and line
+			fragments, are left empty without OCR (see is_blank). Negative, the default, to run OCR on every cell
+		:param ocr_report: dict filled with the number of cells, OCR calls and skipped blank cells per image path
+		:param ocr_engine: name of the OCR engine, 'tesseract', 'tesserocr' or 'stub' (see ocr_engine), or an engine
+		:param ocr_batch: number of cells read by one OCR engine call in 'cell' mode
+		:param image_data: dict of image file path to the bytes of the file, for images already read
+		'''
+		if ocr_mode not in ['cell', 'image']:
+			raise ValueError("unknown OCR mode: {}".format(ocr_mode))
+		if preprocess not in ['full', 'lean']:
+			raise ValueError("unknown preprocessing mode: {}".format(preprocess))
+		if cell_detector not in ['contour', 'grid']:
+			raise ValueError("unknown cell detector: {}".format(cell_detector))
+		self.cell_detector = cell_detector
+		self.blank_threshold = blank_threshold
+		self.ocr_report = ocr_report
+		self.preprocess = preprocess
+		self.max_side = max_side
+		self.buffers = {}
+		self.image_data = image_data or {}
+		self.ocr_mode = ocr_mode
+		self.ocr_timeout = ocr_timeout
+		self.engine = ocr_engine if isinstance(ocr_engine, ocr_engine_base) else get_ocr_engine(ocr_engine, OCR_LANG, ocr_timeout)
+		self.ocr_batch = max(1, int(ocr_batch))
+		self.ocr_cache = ocr_cache
+		self.pool = ocr_pool(ocr_workers)
+		self.table_raw = []
+		self.tables = collection("Auto-CORPus table processing", "auto-corpus-table.key")
+		with self.pool:
+			# keep up to one image per worker prepared ahead, so whole image OCR of the next images overlaps
+			pending = deque()
+			for image_path in table_images:
+				pending.append(self.__prepare_image(image_path))
+				if len(pending) > self.pool.workers:
+					self.__process_image(*pending.popleft())
+			while pending:
+				self.__process_image(*pending.popleft())
+
 
+	def to_collection(self):
+		return self.tables
 
 	def to_dict(self):
-		return(self.tables)
+		return self.tables.as_dict()
 
 
@@ -0,0 +1,137 @@
+from html.parser import HTMLParser
+from itertools import accumulate
+
+
+# elements which never have content, html.parser soups close these as soon as they open
+VOID_ELEMENTS = {
+	'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img', 'input',
+	'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr'
+}
+# style values of elements which are stripped from every soup
+HIDDEN_STYLES = {'display:none', 'visibility:hidden'}
+
+
+class table_scanner(HTMLParser):
+	'''
+	event based scan of an html page which cuts it down to the parts table extraction reads: the subtree around each
+	table (its parent and the parent's siblings, where footers live), title, caption and footer candidates, and hidden
+	elements. No tree is built, so scripts, navigation and references cost only tokenisation.
+
+	Config rules are matched loosely here (a superset of what BeautifulSoup matches), the exact matching is still done
+	on the reduced soup.
+	'''
+
+	def __get_rule(self, config, key):
+		"""
+		turn a config rule into a set of tag names and the attribute values which must appear
+
+		Returns:
+			(names, attrs) or None if the rule is not in the config
+
+		"""
+		if key not in config:
+			return None
+		names = config[key]['name']
+		names = set(names) if isinstance(names, list) else {names}
+		attrs = {}
+		for attr, value in config[key].get('attrs', {}).items():
+			# None and empty values put no requirement on the attribute that can be checked loosely
+			if value is None or value == '' or value == []:
+				continue
+			attrs[attr] = [str(i) for i in value] if isinstance(value, list) else [str(value)]
+		return names, attrs
+
+	def __matches(self, rule, tag, attrs):
+		if rule is None or tag not in rule[0]:
+			return False
+		for attr, values in rule[1].items():
+			attr_value = attrs.get(attr)
+			if attr_value is None or not any(value in attr_value for value in values):
+				return False
+		return True
+
+	def __offset(self):
+		lineno, col = self.getpos()
+		return self.line_starts[lineno - 1] + col
+
+	def handle_starttag(self, tag, attrs):
+		attrs = {k: v for k, v in attrs if v is not None}
+		if self.__matches(self.table_rule, tag, attrs):
+			# keep the table's grandparent so the parent and its siblings survive intact
+			if len(self.stack) >= 2:
+				self.stack[-2][2] = True
+			else:
+				self.whole_document = True
+		wanted = attrs.get('style') in HIDDEN_STYLES or any(self.__matches(rule, tag, attrs) for rule in self.rules)
+		start = self.__offset()
+		if tag in VOID_ELEMENTS:
+			if wanted:
+				self.regions.append((start, start + len(self.get_starttag_text()), ''))
+			return
+		self.stack.append([tag, start, wanted])
+		self.open_tags[tag] = self.open_tags.get(tag, 0) + 1
+
+	def handle_startendtag(self, tag, attrs):
+		self.handle_starttag(tag, attrs)
+		if tag not in VOID_ELEMENTS:
+			start = self.__offset()
+			self.__close(tag, start, start + len(self.get_starttag_text()))
+
+	def handle_endtag(self, tag):
+		if self.open_tags.get(tag):
+			start = self.__offset()
+			self.__close(tag, start, self.html.index('>', start) + 1)
+
+	def __close(self, tag, tag_start, tag_end):
+		# as with BeautifulSoup, an end tag closes the most recent open tag of that name and anything opened after it
+		while True:
+			name, start, wanted = self.stack.pop()
+			self.open_tags[name] -= 1
+			if name == tag:
+				if wanted:
+					self.regions.append((start, tag_end, ''))
+				break
+			# closed implicitly: outside the rest of the page the end tag would not close it, so close it explicitly
+			if wanted:
+				self.regions.append((start, tag_start, '</{}>'.format(name)))
+
+	def reduce(self, html):
+		"""
+		cut an html page down to the parts needed for table extraction
+
+		Args:
+			html: html page as str
+
+		Returns:
+			html: the kept regions in document order, or the whole page if a table has no grandparent element
+
+		"""
+		self.html = html
+		self.line_starts = [0]
+		self.line_starts.extend(accumulate(len(line) + 1 for line in html.split('\n')))
+		self.feed(html)
+		self.close()
+		for name, start, wanted in self.stack:
+			if wanted:
+				self.regions.append((start, len(html), ''))
+		if self.whole_document:
+			return html
+
+		kept = []
+		kept_end = 0
+		for start, end, closer in sorted(self.regions):
+			# regions follow the element nesting, so anything starting inside a kept region is part of it
+			if start < kept_end:
+				continue
+			kept.append(html[start:end] + closer)
+			kept_end = end
+		return ''.join(kept)
+
+	def __init__(self, config):
+		super().__init__()
+		self.table_rule = self.__get_rule(config, 'table')
+		self.rules = [rule for rule in (self.__get_rule(config, key) for key in ['table_title', 'table_caption', 'table_footer']) if rule]
+		self.stack = []
+		self.open_tags = {}
+		self.regions = []
+		self.whole_document = False